@@ -0,0 +1,84 @@
+# cache.py
+from collections import OrderedDict
+import threading
+import time
+import API.metrics as metrics
+
+class ResponseCache:
+    """Cache LRU có TTL cho phản hồi gợi ý đã serialize, khoá theo (userId, thuật toán).
+
+    Mỗi khoá giữ các biến thể (ví dụ danh sách id hoặc danh sách phim đầy đủ theo `limit`) của đúng một
+    revision: phiên bản snapshot mà gợi ý của user thay đổi lần cuối. Request chỉ dùng mục có revision
+    khớp với snapshot nó đang đọc nên không bao giờ nhận dữ liệu cũ; `invalidate` giải phóng sớm các
+    mục của những user có gợi ý vừa thay đổi, các user khác giữ nguyên cache qua các lần tính lại.
+    """
+
+    def __init__(self, max_entries=10000, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()    # {(userId, thuật toán): (revision, {biến thể: (hết hạn lúc, body)})}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, user, algorithm, variant, revision):
+        key = (user, algorithm)
+        expired = False
+        with self.lock:
+            entry = self.entries.get(key)
+            value = entry[1].get(variant) if entry is not None and entry[0] == revision else None
+            if value is not None and value[0] < time.monotonic():
+                del entry[1][variant]
+                if not entry[1]:
+                    del self.entries[key]
+                value, expired = None, True
+            elif value is not None:
+                self.entries.move_to_end(key)
+
+        if expired:
+            metrics.response_cache_evictions.inc(reason="ttl")
+        if value is None:
+            metrics.response_cache_misses.inc()
+            return None
+        metrics.response_cache_hits.inc()
+        return value[1]
+
+    def put(self, user, algorithm, variant, revision, body):
+        if self.max_entries <= 0:
+            return
+        key = (user, algorithm)
+        evicted = 0
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > revision:
+                # Request chậm đọc từ snapshot cũ: không ghi đè mục mới hơn
+                return
+            if entry is None or entry[0] < revision:
+                entry = self.entries[key] = (revision, {})
+            self.entries.move_to_end(key)
+            entry[1][variant] = (time.monotonic() + self.ttl, body)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                evicted += 1
+            size = len(self.entries)
+
+        if evicted:
+            metrics.response_cache_evictions.inc(evicted, reason="lru")
+        metrics.response_cache_entries.set(size)
+
+    def invalidate(self, algorithm, users):
+        """Xoá các mục của `users` cho một thuật toán; trả về số mục đã xoá."""
+        with self.lock:
+            if len(users) > len(self.entries):
+                keys = [key for key in self.entries if key[1] == algorithm and key[0] in users]
+            else:
+                keys = [(user, algorithm) for user in users if (user, algorithm) in self.entries]
+            for key in keys:
+                del self.entries[key]
+            size = len(self.entries)
+
+        if keys:
+            metrics.response_cache_evictions.inc(len(keys), reason="invalidated")
+        metrics.response_cache_entries.set(size)
+        return len(keys)
@@ -1,219 +1,635 @@
 # community_recommendation.py
 import networkx as nx
+import numpy as np
 import pandas as pd
 from collections import Counter
+from collections.abc import Mapping
+from itertools import islice
 import community.community_louvain as community_louvain
-from itertools import combinations
+import hashlib
+import heapq
+import json
+import math
+import os
 import random
+import API.metrics as metrics
+import API.sparse_graph as sg
 
 top_n = 20
 
-def girvan_newman(graph, edges):
-    # Detect communities using Girvan-Newman algorithm
-    communities = list(nx.community.girvan_newman(graph))
-    modularity_df = pd.DataFrame(
-        [
-            [k + 1, nx.community.modularity(graph, communities[k])]
-            for k in range(len(communities))
-        ],
-        columns=["k", "modularity"],
-    )
-    best_k = (modularity_df.loc[modularity_df["modularity"].idxmax()]["k"]).astype(int)
+# Ngưỡng liên kết tốt cho từng heuristic dự đoán liên kết
+link_thresholds = {
+    "Common Neighbors": 1,
+    "Jaccard Coefficient": 0.1,
+    "Adamic-Adar Index": 0.5,
+    "Preferential Attachment": 1.0,
+}
+# Số ứng viên liên kết giữ lại cho mỗi user theo từng heuristic
+top_k_links = 10
+# Nhân trọng số liên kết với rating của user hàng xóm khi xếp hạng phim gợi ý
+weight_by_rating = False
+# Sinh ứng viên liên kết: "exhaustive" duyệt mọi cặp cách 2 bước, "lsh" chỉ chấm các user gần nhất
+# theo chỉ mục MinHash-LSH trên tập hàng xóm, "auto" dùng lsh khi đồ thị có từ lsh_min_users user
+link_candidates = "auto"
+lsh_min_users = 5000
+lsh_candidates = 50
+# 64 band × 2 hàng: cặp có Jaccard hàng xóm 0.2 rơi chung bucket với xác suất ~93%
+lsh_num_perm = 128
+lsh_bands = 64
+lsh_max_bucket = 1000
+
+# Girvan-Newman: dừng khi modularity không cải thiện sau gn_patience mức liên tiếp
+# hoặc khi đạt gn_target_k cộng đồng; gn_betweenness_k > 0 thì xấp xỉ edge betweenness
+# bằng cách lấy mẫu gn_betweenness_k node nguồn
+gn_patience = 5
+gn_target_k = None
+gn_betweenness_k = None
+gn_seed = 42
+# Tệp lưu phân hoạch Girvan-Newman đã chọn để không phải tính lại khi khởi động lại
+gn_cache_path = "girvan_newman_partition.json"
+
+# Louvain: độ phân giải modularity (lớn hơn 1 cho nhiều cộng đồng nhỏ hơn), seed cố định để kết quả
+# ổn định giữa các lần làm mới, và khởi tạo từ phân hoạch trước. Nếu số user bị ảnh hưởng bởi rating
+# mới không quá louvain_local_fraction số node thì chỉ xét di chuyển các user đó và hàng xóm của chúng
+louvain_resolution = 1.0
+louvain_seed = 42
+louvain_warm_start = True
+louvain_local_fraction = 0.1
+
+# Information diffusion: số lượt mô phỏng Monte Carlo, xác suất lây cơ bản, có dùng
+# trọng số cạnh hay không, và ngưỡng xác suất kích hoạt để coi một user là bị lây nhiễm
+ic_runs = 1000
+ic_probability = 0.05
+ic_weighted = True
+ic_activation_threshold = 0.1
+ic_seed = 42
+ic_processes = os.cpu_count()
+# Chiến lược chọn user nguồn cho IC: "degree_discount", "celf" (CELF++) hoặc "random"
+ic_seed_strategy = "degree_discount"
+ic_seed_count = 10
+# Số lượt mô phỏng cho mỗi ước lượng độ lan truyền và số ứng viên (bậc cao nhất) của CELF
+celf_runs = 100
+celf_candidates = 50
+
+# Tầng dự phòng cho user chưa có gợi ý (cold start): trọng số mỗi lượt đánh giá giảm một nửa sau
+# popularity_half_life_days ngày tính đến rating mới nhất, giữ fallback_size phim đứng đầu mỗi bảng xếp hạng
+popularity_half_life_days = 30.0
+fallback_size = 100
+
+# Trạng thái của lần chạy đầy đủ gần nhất, dùng cho cập nhật tăng dần khi có rating mới
+link_partners = {}     # {user: {partner: {method: score}}} top-k liên kết dự đoán của user
+link_followers = {}    # {partner: set(user)} chỉ mục ngược của link_partners
+infected_users = {}    # {seed_strategy: set(user)} các user bị lây nhiễm trong lần mô phỏng IC gần nhất
+seed_sets = {}         # {seed_strategy: (phiên bản đồ thị, [user])} tập nguồn đã chọn cho từng phiên bản đồ thị
+louvain_partition = {}  # {user: community} phân hoạch Louvain gần nhất, dùng làm điểm khởi đầu
+louvain_touched = set() # các user có cạnh thay đổi kể từ lần chạy Louvain gần nhất
+link_index = sg.MinHashIndex(lsh_num_perm, lsh_bands, lsh_max_bucket)  # rỗng nếu lần chạy predict_links gần nhất duyệt mọi cặp
+
+def _graph_fingerprint(graph, node_ids):
+    # Dấu vân tay của đồ thị và tham số dừng sớm, dùng làm khoá cho phân hoạch đã lưu
+    digest = hashlib.sha1(repr((gn_patience, gn_target_k, gn_betweenness_k, gn_seed)).encode())
+    digest.update(repr(list(map(str, node_ids))).encode())
+    edges = sorted((min(u, v), max(u, v), w) for u, v, w in graph.edges(data='weight', default=1))
+    digest.update(repr(edges).encode())
+    return digest.hexdigest()
+
+def _load_cached_partition(fingerprint):
+    if not gn_cache_path or not os.path.exists(gn_cache_path):
+        return None
+    try:
+        with open(gn_cache_path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("fingerprint") != fingerprint:
+        return None
+    return {node: community_id for node, community_id in cached["partition"]}
+
+def _save_cached_partition(fingerprint, partition):
+    if not gn_cache_path:
+        return
+    with open(gn_cache_path, "w") as f:
+        json.dump({"fingerprint": fingerprint, "partition": list(partition.items())}, f)
+
+def girvan_newman_partition(graph, node_ids):
+    """Duyệt lười cây phân cấp Girvan-Newman và trả về phân hoạch có modularity cao nhất.
+
+    `graph` có node là chỉ số 0..n-1 ứng với `node_ids`; phân hoạch trả về theo chỉ số.
+    Dừng sớm theo gn_patience/gn_target_k thay vì dựng toàn bộ dendrogram, và dùng
+    lại phân hoạch đã lưu nếu đồ thị không đổi.
+    """
+    fingerprint = _graph_fingerprint(graph, node_ids)
+    partition = _load_cached_partition(fingerprint)
+    if partition is not None:
+        return partition
+
+    most_valuable_edge = None
+    if gn_betweenness_k:
+        def most_valuable_edge(G):
+            centrality = nx.edge_betweenness_centrality(G, k=min(gn_betweenness_k, len(G)), seed=gn_seed)
+            return max(centrality, key=centrality.get)
+
+    best_communities, best_modularity, stale_levels = None, -math.inf, 0
+    for communities in nx.community.girvan_newman(graph, most_valuable_edge):
+        modularity = nx.community.modularity(graph, communities)
+        if modularity > best_modularity:
+            best_communities, best_modularity, stale_levels = communities, modularity, 0
+        else:
+            stale_levels += 1
+        if stale_levels >= gn_patience or (gn_target_k and len(communities) >= gn_target_k):
+            break
 
+    # Đồ thị không có cạnh: mỗi thành phần liên thông là một cộng đồng
+    if best_communities is None:
+        best_communities = list(nx.connected_components(graph))
+
+    partition = {node: idx for idx, community in enumerate(best_communities) for node in community}
+    _save_cached_partition(fingerprint, partition)
+    return partition
+
+class RankedMovies(list):
+    """Danh sách tmdbId đã xếp hạng kèm điểm của thuật toán: `scores[i]` là điểm của phim thứ i.
+
+    Vẫn là một list tmdbId nên được serialize như trước; hai danh sách chỉ bằng nhau khi cả thứ tự
+    phim lẫn điểm đều giống nhau.
+    """
+
+    def __init__(self, movies=(), scores=()):
+        super().__init__(movies)
+        self.scores = list(scores)
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        pairs = list(pairs)
+        return cls([movie for movie, _ in pairs], [score for _, score in pairs])
+
+    def head(self, n):
+        return RankedMovies(self[:n], self.scores[:n])
+
+    def without(self, movies):
+        """Danh sách đã bỏ các phim trong `movies`, giữ nguyên thứ tự và điểm."""
+        return RankedMovies.from_pairs((movie, score) for movie, score in zip(self, self.scores) if movie not in movies)
+
+    def __eq__(self, other):
+        equal = list.__eq__(self, other)
+        if equal is NotImplemented or not equal:
+            return equal
+        return not isinstance(other, RankedMovies) or self.scores == other.scores
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+class CommunityRecommendations(Mapping):
+    """Gợi ý theo cộng đồng cho một phân hoạch bất kỳ.
+
+    Chỉ lưu top-N phim phổ biến của mỗi cộng đồng; danh sách của từng user được
+    lọc bỏ các phim đã xem tại thời điểm truy cập.
+    """
+
+    def __init__(self, partition, members, community_top, watched):
+        self.partition = partition          # {user: community_id}
+        self.members = members              # {community_id: set(user)}
+        self.community_top = community_top  # {community_id: [tmdbId]}
+        self.watched = watched              # {user: set(tmdbId)}
+
+    def __getitem__(self, user):
+        movies_watched = self.watched.get(user, ())
+        top = self.community_top[self.partition[user]]
+        if not isinstance(top, RankedMovies):
+            return [movie for movie in top if movie not in movies_watched]
+        return RankedMovies.from_pairs(
+            (movie, score) for movie, score in zip(top, top.scores) if movie not in movies_watched
+        )
+
+    def __contains__(self, user):
+        return user in self.partition
+
+    def __iter__(self):
+        return iter(self.partition)
+
+    def __len__(self):
+        return len(self.partition)
+
+    def copy(self):
+        # Các tập hợp bên trong được thay thế chứ không sửa tại chỗ nên chỉ cần sao chép nông
+        return CommunityRecommendations(
+            dict(self.partition), dict(self.members), dict(self.community_top), dict(self.watched)
+        )
+
+    def changed_users(self, previous):
+        """Các user có thể có danh sách khác so với bản `previous`, so theo cộng đồng, top phim và
+        phim đã xem thay vì dựng lại danh sách của từng user."""
+        changed_communities = {
+            community_id for community_id, top in self.community_top.items()
+            if previous.community_top.get(community_id) != top
+        }
+        changed = {user for user in previous.partition if user not in self.partition}
+        for user, community_id in self.partition.items():
+            if (community_id in changed_communities or previous.partition.get(user) != community_id
+                    or previous.watched.get(user) != self.watched.get(user)):
+                changed.add(user)
+        return changed
+
+def community_recommendations(partition, edges):
+    """Gợi ý phim phổ biến trong cộng đồng cho một phân hoạch {user: community_id}."""
+    ratings = pd.DataFrame(edges, columns=["userId", "tmdbId"]).drop_duplicates()
+    ratings = ratings[ratings["userId"].isin(partition.keys())]
+    ratings = ratings.assign(community=ratings["userId"].map(partition))
+
+    # Đảo phân hoạch một lần thay vì quét toàn bộ user cho mỗi cộng đồng
+    members = {}
+    for user, community_id in partition.items():
+        members.setdefault(community_id, set()).add(user)
 
-    # Recommend popular movies within each community
-    partition = {node: idx for idx, community in enumerate(communities[best_k - 1]) for node in community}
+    # Đếm số lượt xem mỗi phim trong từng cộng đồng bằng một lần groupby
+    counts = (
+        ratings.groupby(["community", "tmdbId"]).size()
+        .reset_index(name="count")
+        .sort_values(["community", "count"], ascending=[True, False], kind="stable")
+    )
+    # Điểm của mỗi phim là số thành viên cộng đồng đã xem
+    top_movies = counts.groupby("community").head(top_n)
+    community_top = {community_id: RankedMovies() for community_id in members}
+    community_top.update({
+        community_id: RankedMovies(group["tmdbId"].tolist(), group["count"].tolist())
+        for community_id, group in top_movies.groupby("community")
+    })
+
+    watched = {user: set(movies) for user, movies in ratings.groupby("userId")["tmdbId"]}
+    return CommunityRecommendations(partition, members, community_top, watched)
+
+class Popularity:
+    """Độ phổ biến của phim cho tầng dự phòng: số lượt đánh giá và điểm gần đây (mỗi lượt có trọng số
+    2^((timestamp - mốc) / chu kỳ bán rã)), cập nhật tăng dần theo từng rating mới."""
+
+    def __init__(self):
+        self.half_life = popularity_half_life_days * 86400.0
+        self.reference = None   # Mốc thời gian của trọng số 1
+        self.counts = {}        # {tmdbId: số lượt đánh giá}
+        self.scores = {}        # {tmdbId: tổng trọng số theo thời gian}
+        self._ranking = None
+
+    def build(self, ratings):
+        """Tính lại từ DataFrame rating (userId, tmdbId, timestamp); mỗi cặp (user, phim) chỉ tính một lần."""
+        ratings = ratings.drop_duplicates(['userId', 'tmdbId'], keep='last')
+        timestamps = ratings['timestamp'].to_numpy(np.float64)
+        self.half_life = popularity_half_life_days * 86400.0
+        self.reference = float(timestamps.max()) if len(timestamps) else None
+        weights = np.exp2((timestamps - (self.reference or 0.0)) / self.half_life)
+        grouped = pd.Series(weights).groupby(ratings['tmdbId'].to_numpy())
+        counts, scores = grouped.size(), grouped.sum()
+        self.counts = dict(zip(counts.index.tolist(), counts.tolist()))
+        self.scores = dict(zip(scores.index.tolist(), scores.tolist()))
+        self._ranking = None
+
+    def add(self, movie, timestamp):
+        if self.reference is None:
+            self.reference = float(timestamp)
+        exponent = (timestamp - self.reference) / self.half_life
+        if exponent > 64:
+            # Dời mốc để điểm không tràn số; mọi điểm nhân cùng một hệ số nên thứ hạng không đổi
+            self.scores = {m: score * 2.0 ** -exponent for m, score in self.scores.items()}
+            self.reference, exponent = float(timestamp), 0.0
+        self.counts[movie] = self.counts.get(movie, 0) + 1
+        self.scores[movie] = self.scores.get(movie, 0.0) + 2.0 ** exponent
+        self._ranking = None
+
+    def ranking(self):
+        """(phổ biến nhất, phổ biến gần đây nhất): mỗi bảng là RankedMovies gồm tối đa fallback_size phim."""
+        if self._ranking is None:
+            # Hoà điểm thì xếp theo tmdbId để kết quả ổn định
+            self._ranking = tuple(
+                RankedMovies.from_pairs(
+                    (movie, values[movie])
+                    for movie in heapq.nsmallest(fallback_size, values, key=lambda movie: (-values[movie], movie))
+                )
+                for values in (self.counts, self.scores)
+            )
+        return self._ranking
+
+popularity = Popularity()
 
-    user_movie_history = {}
-    for user, movie in edges:
-        if user not in user_movie_history:
-            user_movie_history[user] = []
-        user_movie_history[user].append(movie)
-
-    community_recommendations = {}
-    for community_id in set(partition.values()):
-        community_members = [user for user, com_id in partition.items() if com_id == community_id]
-        movie_counter = Counter()
-        for user in community_members:
-            movies = user_movie_history.get(user, [])
-            movie_counter.update(movies)
-
-        # Select top 5 popular movies within the community
-        popular_movies = [movie for movie, _ in movie_counter.most_common(top_n)]
-        community_recommendations[community_id] = popular_movies
-
-    # Create user-specific recommendations
-    user_recommendations = {}
-    for user, community_id in partition.items():
-        movies_watched = set(user_movie_history.get(user, []))
-        recommendations = [movie for movie in community_recommendations[community_id] if movie not in movies_watched]
-        user_recommendations[user] = recommendations
+def girvan_newman(graph, edges):
+    graph, user_ids = sg.as_networkx(graph)
+    # Detect communities using Girvan-Newman algorithm
+    partition = {user_ids[i]: c for i, c in girvan_newman_partition(graph, user_ids).items()}
 
+    # Recommend popular movies within each community
+    with metrics.stage("assembly:girvan_newman") as result:
+        user_recommendations = community_recommendations(partition, edges)
+        result.output_size = len(user_recommendations)
     return user_recommendations
 
-def louvain(graph, edges):
-    partition = community_louvain.best_partition(graph)
-    value = list(partition.values())
+def _align_communities(partition, previous):
+    """Đánh lại số cộng đồng để mỗi cộng đồng giữ id của cộng đồng cũ trùng nhiều thành viên nhất."""
+    overlaps = Counter((c, previous[node]) for node, c in partition.items() if node in previous)
+    mapping, used = {}, set()
+    for (c, old), _ in sorted(overlaps.items(), key=lambda item: (-item[1], item[0])):
+        if c not in mapping and old not in used:
+            mapping[c] = old
+            used.add(old)
+    next_id = 0
+    for c in sorted(set(partition.values()) - mapping.keys()):
+        while next_id in used:
+            next_id += 1
+        mapping[c] = next_id
+        used.add(next_id)
+    return {node: mapping[c] for node, c in partition.items()}
+
+def louvain_partition_of(graph, matrix, user_ids):
+    """Phân hoạch Louvain {chỉ số node: cộng đồng} có trọng số, khởi tạo từ louvain_partition nếu có.
+
+    Khi chỉ một phần nhỏ user bị ảnh hưởng kể từ lần chạy trước, chỉ các user đó (và user mới) được xét
+    di chuyển giữa các cộng đồng, lan sang hàng xóm khi có user đổi cộng đồng; còn lại chạy Louvain
+    đầy đủ bắt đầu từ phân hoạch trước. Id cộng đồng được giữ ổn định giữa các lần chạy.
+    """
+    options = dict(weight="weight", resolution=louvain_resolution, random_state=louvain_seed)
+    index = {user: i for i, user in enumerate(user_ids.tolist())}
+    previous = {index[user]: c for user, c in louvain_partition.items() if user in index}
+    if not louvain_warm_start or not previous:
+        return community_louvain.best_partition(sg.as_networkx(graph)[0], **options)
+
+    touched = {index[user] for user in louvain_touched if user in index}
+    touched.update(i for i in range(len(user_ids)) if i not in previous)
+    # User mới bắt đầu ở một cộng đồng riêng
+    next_id = max(previous.values()) + 1
+    initial = [previous.get(i, next_id + i) for i in range(len(user_ids))]
+    if len(touched) <= louvain_local_fraction * len(user_ids):
+        labels = sg.move_nodes(matrix, initial, touched, louvain_resolution)
+        partition = dict(enumerate(labels.tolist()))
+    else:
+        initial = dict(enumerate(initial))
+        partition = community_louvain.best_partition(sg.as_networkx(graph)[0], partition=initial, **options)
+    return _align_communities(partition, previous)
 
-    user_movie_history = {}
-    for user, movie in edges:
-        if user not in user_movie_history:
-            user_movie_history[user] = []
-        user_movie_history[user].append(movie)
+def louvain(graph, edges):
+    matrix, user_ids = sg.adjacency(graph, weight="weight")
+    partition = {user_ids[i]: c for i, c in louvain_partition_of(graph, matrix, user_ids).items()}
+    louvain_partition.clear()
+    louvain_partition.update(partition)
+    louvain_touched.clear()
 
     # Tạo danh sách phim phổ biến trong từng cộng đồng
-    community_recommendations = {}
-    for community_id in set(value):
-        # Lấy danh sách các thành viên trong cộng đồng
-        community_members = [user for user, com_id in partition.items() if com_id == community_id]
-
-        # Đếm các bộ phim đã xem trong cộng đồng
-        movie_counter = Counter()
-        for user in community_members:
-            movies = user_movie_history.get(user, [])
-            movie_counter.update(movies)
-
-        # Chọn top 5 phim phổ biến trong cộng đồng
-        popular_movies = [movie for movie, _ in movie_counter.most_common(top_n)]
-        community_recommendations[community_id] = popular_movies
-
-    # Tạo gợi ý cho từng người dùng
-    user_recommendations = {}
-    for user, community_id in partition.items():
-        # Lấy phim phổ biến trong cộng đồng mà người dùng chưa xem
-        movies_watched = set(user_movie_history.get(user, []))
-        recommendations = [movie for movie in community_recommendations[community_id] if movie not in movies_watched]
-        user_recommendations[user] = recommendations
-
+    with metrics.stage("assembly:louvain") as result:
+        user_recommendations = community_recommendations(partition, edges)
+        result.output_size = len(user_recommendations)
     return user_recommendations
 
 def predict_links(graph, edges):
     # === 2. Dự đoán liên kết bằng Heuristics ===
-    predicted_links = []
-
-    # Ngưỡng liên kết tốt
-    threshold_CN = 1
-    threshold_JC = 0.1
-    threshold_AA = 0.5
-    threshold_PA = 1.0
-
-    # Common Neighbors
-    cn_scores = []
-    for u, v in combinations(graph.nodes(), 2):  # Tất cả các cặp user
-        if not graph.has_edge(u, v):  # Chỉ xét cặp user chưa liên kết
-            common_neighbors = len(list(nx.common_neighbors(graph, u, v)))
-            if common_neighbors >= threshold_CN:
-                cn_scores.append((u, v, common_neighbors))
-
-    # Jaccard Coefficient
-    jaccard_scores = list(nx.jaccard_coefficient(graph))
-    for u, v, score in jaccard_scores:
-        if score >= threshold_JC:
-            predicted_links.append((u, v, "Jaccard Coefficient", score))
-
-    # Adamic-Adar Index
-    adamic_adar_scores = list(nx.adamic_adar_index(graph))
-    for u, v, score in adamic_adar_scores:
-        if score >= threshold_AA:
-            predicted_links.append((u, v, "Adamic-Adar Index", score))
-
-    # Preferential Attachment
-    pa_scores = list(nx.preferential_attachment(graph))
-    for u, v, score in pa_scores:
-        if score >= threshold_PA:
-            predicted_links.append((u, v, "Preferential Attachment", score))
+    # Chấm điểm CN, Jaccard, Adamic-Adar, PA trong một lượt trên ma trận kề thưa,
+    # mỗi user chỉ giữ top-k ứng viên vượt ngưỡng của từng phương pháp
+    matrix, user_ids = sg.adjacency(graph)
+    user_ids = user_ids.tolist()
+
+    link_partners.clear()
+    link_followers.clear()
+    link_index.clear()
+    use_index = link_candidates == "lsh" or (link_candidates == "auto" and len(user_ids) >= lsh_min_users)
+    if use_index and isinstance(graph, sg.UserProjection):
+        # Chỉ chấm các cặp ứng viên lấy từ chỉ mục thay vì mọi cặp cách 2 bước
+        with metrics.stage("candidates:predict_links") as result:
+            link_index.build(graph.incidence, user_ids)
+            rows, cols = [], []
+            for i, user in enumerate(user_ids):
+                neighbors = [user_ids[j] for j in matrix.indices[matrix.indptr[i]:matrix.indptr[i + 1]]]
+                for partner, _ in link_index.query(user, lsh_candidates, exclude=neighbors):
+                    rows.append(i)
+                    cols.append(link_index.users.index[partner])
+            result.output_size = len(rows)
+        scored = sg.score_candidate_links(matrix, rows, cols, link_thresholds, k=top_k_links)
+    else:
+        scored = sg.score_links(matrix, link_thresholds, k=top_k_links)
+    for i, j, method, score in scored:
+        u, v = user_ids[i], user_ids[j]
+        link_partners.setdefault(u, {}).setdefault(v, {})[method] = score
+        link_followers.setdefault(v, set()).add(u)
 
     # === 3. Gợi ý phim cho user dựa trên liên kết mạnh ===
-    recommendations = {}
-
-    # Kiểm tra nếu edges là list, chuyển thành DataFrame
-    if isinstance(edges, list):
-        edges = pd.DataFrame(edges, columns=["userId", "tmdbId"])
-    
-    # Tạo dictionary lưu phim mà mỗi user đã xem
-    user_to_movies = edges.groupby('userId')['tmdbId'].apply(set).to_dict()
-
-    for u, v, method, score in predicted_links:
-        # Khởi tạo danh sách gợi ý nếu chưa có
-        if u not in recommendations:
-            recommendations[u] = set()
-        if v not in recommendations:
-            recommendations[v] = set()
-
-        # Gợi ý phim từ user này cho user kia
-        movies_u = user_to_movies.get(u, set())
-        movies_v = user_to_movies.get(v, set())
+    # Chỉ mục user -> {phim: rating} được tính sẵn một lần
+    with metrics.stage("assembly:predict_links") as result:
+        user_to_movies = _user_movie_index(graph, edges)
 
-        recommendations[u].update(movies_v - movies_u)  # Gợi ý phim của v cho u
-        recommendations[v].update(movies_u - movies_v)  # Gợi ý phim của u cho v
-
-    # Lưu trữ kết quả gợi ý top n phim cho mỗi user
-    user_recommendations = {}
-
-    # Đếm số lần mỗi bộ phim được gợi ý cho mỗi user
-    for user, movies in recommendations.items():
-        movie_counts = Counter(movies)  # Đếm số lần mỗi phim xuất hiện
-        top_movies = movie_counts.most_common(top_n)  # Lấy top n phim
-        user_recommendations[user] = [movie for movie, _ in top_movies]
+        # Lưu trữ kết quả gợi ý top n phim cho mỗi user
+        user_recommendations = {}
+        for user, partners in link_partners.items():
+            user_recommendations[user] = _recommend_from_partners(partners, lambda x: user_to_movies.get(x, {}), user)
+        result.output_size = len(user_recommendations)
 
     return user_recommendations
 
-def independent_cascade(G, initial_nodes, p=0.1):
-    """Mô phỏng lan truyền thông tin theo mô hình Independent Cascade (IC)."""
-    if not initial_nodes:
-        return set()  # Trả về một tập hợp rỗng nếu không có nút khởi tạo
-
-    active = set(initial_nodes)  # Các nút đã lây nhiễm
-    new_active = set(initial_nodes)  # Các nút mới bị lây nhiễm trong mỗi vòng lặp
-
-    while new_active:
-        next_active = set()  # Các nút sẽ bị lây nhiễm trong vòng tiếp theo
-        for node in new_active:
-            for neighbor in G.neighbors(node):
-                if neighbor not in active:  # Chỉ lây nhiễm nếu hàng xóm chưa bị lây nhiễm
-                    if random.random() < p:  # Xác suất lây nhiễm
-                        next_active.add(neighbor)
-        if not next_active:  # Nếu không có nút nào bị lây nhiễm trong vòng này, dừng lại
-            break
-        active.update(next_active)
-        new_active = next_active
-
-    return active
-
-def information_diffusion_ic(user_user, edges, top_n=20):
+def _user_movie_index(graph, edges):
+    # Chỉ mục {user: {tmdbId: rating}}, lấy từ ma trận rating nếu có
+    if isinstance(graph, sg.UserProjection):
+        return graph.movie_index()
+    user_to_movies = {}
+    for user, movie in edges:
+        user_to_movies.setdefault(user, {})[movie] = 1.0
+    return user_to_movies
+
+def _link_weights(partners):
+    # Chuẩn hoá điểm của từng heuristic theo giá trị lớn nhất của user rồi cộng lại
+    best = Counter()
+    for scores in partners.values():
+        for method, score in scores.items():
+            best[method] = max(best[method], score)
+    return {
+        partner: sum(score / best[method] for method, score in scores.items() if best[method] > 0)
+        for partner, scores in partners.items()
+    }
+
+def _recommend_from_partners(partners, movies_of, user):
+    # Mỗi phim được cộng điểm liên kết của các user liên kết đã xem phim đó
+    movies_watched = movies_of(user)
+    movie_scores = Counter()
+    for partner, weight in _link_weights(partners).items():
+        for movie, rating in movies_of(partner).items():
+            if movie not in movies_watched:
+                movie_scores[movie] += weight * rating if weight_by_rating else weight
+
+    # Heap giới hạn kích thước top_n thay vì sắp xếp toàn bộ ứng viên
+    top_movies = heapq.nlargest(top_n, movie_scores.items(), key=lambda item: item[1])
+    return RankedMovies.from_pairs(top_movies)
+
+def select_seeds(matrix, user_ids, strategy=None, k=None):
+    """Chọn các user nguồn cho IC; tập nguồn được tính một lần cho mỗi phiên bản đồ thị."""
+    strategy = strategy or ic_seed_strategy
+    k = min(k or ic_seed_count, len(user_ids))
+    version = sg.fingerprint(matrix, user_ids)
+    cached = seed_sets.get(strategy)
+    if cached is not None and cached[0] == version and len(cached[1]) == k:
+        return cached[1]
+
+    if strategy == "degree_discount":
+        seeds = sg.degree_discount_seeds(matrix, k, p=ic_probability)
+    elif strategy == "celf":
+        seeds = sg.celf_seeds(
+            matrix, k, p=ic_probability, runs=celf_runs, weighted=ic_weighted,
+            seed=ic_seed, candidates=celf_candidates,
+        )
+    elif strategy == "random":
+        seeds = random.Random(ic_seed).sample(range(len(user_ids)), k=k)
+    else:
+        raise ValueError(f"Unknown seed strategy '{strategy}'")
+
+    seeds = [user_ids[i] for i in seeds]
+    seed_sets[strategy] = (version, seeds)
+    return seeds
+
+def information_diffusion_ic(user_user, edges, top_n=20, seed_strategy=None):
     # Tạo một dictionary để lưu trữ kết quả gợi ý phim cho mỗi người dùng
     top_recommendations = {}
 
-    # Chọn ngẫu nhiên một số người dùng làm nguồn lan truyền
-    initial_nodes = random.sample(list(user_user.nodes()), k=10)
+    matrix, user_ids = sg.adjacency(user_user)
+    user_ids = user_ids.tolist()
 
-    if isinstance(edges, list):
-        edges = pd.DataFrame(edges, columns=["userId", "tmdbId"])
-    
-    # Mô phỏng lan truyền thông tin
-    infected_nodes = independent_cascade(user_user, initial_nodes, p=0.05)
+    # Chọn các user nguồn lan truyền theo chiến lược tối đa hoá ảnh hưởng
+    seed_strategy = seed_strategy or ic_seed_strategy
+    index = {user: i for i, user in enumerate(user_ids)}
+    initial_nodes = [index[user] for user in select_seeds(matrix, user_ids, seed_strategy)]
+
+    # Mô phỏng Monte Carlo: user bị lây nhiễm là user có xác suất được kích hoạt đủ lớn
+    activation = sg.simulate_cascades(
+        matrix, initial_nodes, p=ic_probability, runs=ic_runs,
+        weighted=ic_weighted, seed=ic_seed, processes=ic_processes,
+    )
+    infected_nodes = {user_ids[i] for i in np.flatnonzero(activation >= ic_activation_threshold)}
+    infected_users[seed_strategy] = infected_nodes
+
+    # Gợi ý cho mỗi user bị lây nhiễm các phim mà những user bị lây nhiễm khác đã xem
+    with metrics.stage(f"assembly:information_diffusion_ic_{seed_strategy}") as result:
+        user_to_movies = _user_movie_index(user_user, edges)
+        top_recommendations.update(
+            _recommend_from_infected(infected_nodes, lambda x: user_to_movies.get(x, {}), top_n)
+        )
+        result.output_size = len(top_recommendations)
+
+    return top_recommendations
+
+def _recommend_from_infected(infected_nodes, movies_of, top_n=20):
+    # Đếm một lần số user bị lây nhiễm đã xem mỗi phim
+    movie_counts = Counter()
+    for node in infected_nodes:
+        movie_counts.update(movies_of(node).keys())
+    # Hoà điểm thì xếp theo tmdbId để kết quả không phụ thuộc thứ tự duyệt tập user (khác nhau giữa các tiến trình)
+    ranked_movies = sorted(movie_counts.items(), key=lambda item: (-item[1], item[0]))
 
-    edges['userId'] = edges['userId'].astype(str)
-    # Duyệt qua các nút bị lây nhiễm và gợi ý phim
+    # Loại bỏ các phim mà người dùng đã xem, lấy top N phim được nhiều user bị lây nhiễm xem nhất;
+    # điểm của mỗi phim là số user bị lây nhiễm đã xem
+    recommendations = {}
     for node in infected_nodes:
-        # Lấy các phim mà người dùng bị lây nhiễm đã xem
-        user_rated_movies = edges[edges['userId'] == node]['tmdbId']
-
-        # Tạo danh sách phim được đề xuất cho người dùng này
-        recommended_movies = []
-        
-        # Duyệt qua các người dùng bị lây nhiễm khác để gợi ý phim
-        for infected_user in infected_nodes:
-            node = str(node)
-            if infected_user != node:  # Không gợi ý phim đã xem của chính người dùng
-                user_rated_movies = edges[edges['userId'] == infected_user]['tmdbId']
-                recommended_movies.extend(user_rated_movies)
-
-        # Loại bỏ các phim mà người dùng đã xem
-        recommended_movies = list(set(recommended_movies) - set(user_rated_movies))  # Loại bỏ trùng
-        recommended_movies = recommended_movies[:top_n]  # Lấy top N phim
-
-        # Lưu kết quả gợi ý cho người dùng vào dictionary
-        top_recommendations[node] = recommended_movies
-
-    return top_recommendations
\ No newline at end of file
+        movies_watched = movies_of(node)
+        recommendations[node] = RankedMovies.from_pairs(
+            islice(((m, count) for m, count in ranked_movies if m not in movies_watched), top_n)
+        )
+    return recommendations
+
+# === Cập nhật tăng dần khi có một rating (user, movie) mới ===
+# Các hàm dưới đây thao tác trên sg.GraphCore (chỉ số int32); id ngoài chỉ được dùng khi ghi
+# vào trạng thái gợi ý (phân hoạch, link_partners, danh sách gợi ý) vốn được API phục vụ trực tiếp
+def add_rating_edge(core, user, movie, rating=1.0):
+    """Thêm cạnh (user, movie) vào đồ thị bipartite và vá đồ thị chiếu user-user tại chỗ.
+
+    Chỉ các user đã xem `movie` bị ảnh hưởng, nên chi phí tỉ lệ với số khán giả của phim.
+    Trả về tập userId bị ảnh hưởng (rỗng nếu rating đã tồn tại).
+    """
+    user_ids = core.users.ids
+    return {user_ids[u] for u in core.add_rating(user, movie, rating)}
+
+def _community_top_movies(core, members):
+    movie_counter = Counter()
+    for member in members:
+        movie_counter.update(core.movies_of(core.users.index[member]).keys())
+    movie_ids = core.movies.ids
+    return RankedMovies.from_pairs((movie_ids[m], count) for m, count in movie_counter.most_common(top_n))
+
+def _update_community(core, user, movie, user_recommendations):
+    partition = user_recommendations.partition
+    u = core.users.index[user]
+
+    if user not in partition:
+        # User mới: gán vào cộng đồng có tổng trọng số liên kết lớn nhất với user; nếu đồ thị chiếu
+        # chưa có cạnh của user (chế độ tương đồng/đã tỉa) thì dùng số phim chung với các user khác
+        user_ids = core.users.ids
+        weights = Counter()
+        for v, weight in (core.neighbors(u) or core.co_raters(u)).items():
+            community_id = partition.get(user_ids[v])
+            if community_id is not None:
+                weights[community_id] += weight
+        if weights:
+            community_id = weights.most_common(1)[0][0]
+        else:
+            community_id = max(partition.values(), default=-1) + 1
+        partition[user] = community_id
+        members = user_recommendations.members
+        members[community_id] = members.get(community_id, set()) | {user}
+
+    # Chỉ tính lại danh sách phim phổ biến của cộng đồng chứa user
+    community_id = partition[user]
+    user_recommendations.watched[user] = set(core.movie_ratings(user))
+    user_recommendations.community_top[community_id] = _community_top_movies(
+        core, user_recommendations.members[community_id]
+    )
+
+def update_girvan_newman(core, user, movie, affected, user_recommendations):
+    _update_community(core, user, movie, user_recommendations)
+
+def update_louvain(core, user, movie, affected, user_recommendations):
+    # Ghi nhận các user bị ảnh hưởng để lần chạy đầy đủ sau chỉ tối ưu lại cộng đồng của họ
+    louvain_touched.update(affected)
+    _update_community(core, user, movie, user_recommendations)
+
+def _score_user_links(core, rows, k=top_k_links):
+    # Chấm điểm lại các hàng `rows` trong một lượt vector hoá trên ma trận kề hiện tại (đã gồm cạnh vá),
+    # chi phí tỉ lệ với số hàng × n. Nếu có chỉ mục LSH thì chỉ chấm các ứng viên của nó
+    matrix = core.adjacency()
+    user_ids = core.users.ids
+    if len(link_index):
+        candidate_rows, candidate_cols = [], []
+        for u in rows:
+            exclude = [user_ids[v] for v in matrix.indices[matrix.indptr[u]:matrix.indptr[u + 1]]]
+            for partner, _ in link_index.query(user_ids[u], lsh_candidates, exclude):
+                x = core.users.index.get(partner)
+                if x is not None:
+                    candidate_rows.append(u)
+                    candidate_cols.append(x)
+        scored = sg.score_candidate_links(matrix, candidate_rows, candidate_cols, link_thresholds, k=k)
+    else:
+        scored = sg.score_links(matrix, link_thresholds, k=k, rows=rows)
+
+    partners = {user_ids[u]: {} for u in rows}
+    for u, v, method, score in scored:
+        partners[user_ids[u]].setdefault(user_ids[v], {})[method] = score
+    return partners
+
+def update_predict_links(core, user, movie, affected, user_recommendations):
+    # Cạnh mới user–(khán giả của phim) được thêm vào chỉ mục LSH để user mới cũng có ứng viên
+    if len(link_index):
+        link_index.add_edges(user, sorted(affected))
+
+    # Chấm điểm lại top-k liên kết của các user bị ảnh hưởng (bậc của họ đã thay đổi)
+    scored = _score_user_links(core, sorted(core.users.index[a] for a in affected))
+    for a, partners in scored.items():
+        for b in link_partners.get(a, {}):
+            link_followers[b].discard(a)
+        for b in partners:
+            link_followers.setdefault(b, set()).add(a)
+        link_partners[a] = partners
+
+    # Xếp hạng lại user bị ảnh hưởng và các user có liên kết tới `user` (phim của `user` đã đổi)
+    to_refresh = set(affected) | link_followers.get(user, set())
+    for x in to_refresh:
+        partners = link_partners.get(x)
+        if partners or x in user_recommendations:
+            user_recommendations[x] = _recommend_from_partners(partners or {}, core.movie_ratings, x)
+
+def update_information_diffusion_ic(core, user, movie, affected, user_recommendations, top_n=20, seed_strategy=None):
+    # Phim mới chỉ làm thay đổi gợi ý nếu user nằm trong tập bị lây nhiễm
+    infected_nodes = infected_users.get(seed_strategy or ic_seed_strategy, set())
+    if user not in infected_nodes:
+        return
+
+    user_recommendations.update(_recommend_from_infected(infected_nodes, core.movie_ratings, top_n))
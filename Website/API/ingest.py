@@ -0,0 +1,103 @@
+# ingest.py
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+# Chỉ đọc các cột cần cho đồ thị với kiểu dữ liệu gọn; metadata phim được đọc riêng trong một lượt khác.
+# Cột số nguyên được đọc bằng kiểu nullable để dòng thiếu giá trị bị bỏ (như dropna) thay vì làm read_csv lỗi
+RATING_DTYPES = {'userId': 'category', 'tmdbId': 'Int32', 'rating': np.float32, 'timestamp': 'Int64'}
+MOVIE_COLUMNS = ['tmdbId', 'title', 'poster', 'date_published']
+CHUNK_SIZE = 100_000
+
+class RatingData(NamedTuple):
+    """Rating dạng cột với user/phim đã được ánh xạ sang mã số nguyên liên tục."""
+    user_ids: np.ndarray      # object, user_ids[code] = userId (theo thứ tự xuất hiện đầu tiên)
+    movie_ids: np.ndarray     # int32, movie_ids[code] = tmdbId
+    user_codes: np.ndarray    # int32
+    movie_codes: np.ndarray   # int32
+    rating: np.ndarray        # float32
+    timestamp: np.ndarray     # int64
+
+def _intern(values, index):
+    """Ánh xạ các giá trị của một chunk sang mã toàn cục, thêm mã mới cho giá trị chưa gặp."""
+    codes, uniques = pd.factorize(values)
+    mapping = np.empty(len(uniques), dtype=np.int32)
+    for i, value in enumerate(uniques.tolist()):
+        mapping[i] = index.setdefault(value, len(index))
+    return mapping[codes]
+
+def read_ratings(path, rows=None, chunksize=CHUNK_SIZE, movie_ids=None):
+    """Đọc file rating theo từng chunk, chỉ giữ các mảng mã số nên RAM đỉnh xấp xỉ kích thước kết quả.
+
+    Nếu có `movie_ids` (ví dụ các phim có metadata từ read_movies) thì bỏ rating của phim ngoài tập đó.
+    """
+    user_index, movie_index = {}, {}
+    parts = {name: [] for name in RatingData._fields[2:]}
+    allowed = None if movie_ids is None else np.fromiter(movie_ids, dtype=np.int64)
+
+    chunks = pd.read_csv(path, usecols=list(RATING_DTYPES), dtype=RATING_DTYPES, nrows=rows, chunksize=chunksize)
+    for chunk in chunks:
+        chunk = chunk.dropna()
+        tmdb_ids = chunk['tmdbId'].to_numpy(np.int32)
+        if allowed is not None:
+            keep = np.isin(tmdb_ids, allowed)
+            chunk, tmdb_ids = chunk[keep], tmdb_ids[keep]
+        # factorize trên cột categorical chỉ băm mã category, giữ thứ tự xuất hiện đầu tiên
+        parts['user_codes'].append(_intern(chunk['userId'].array, user_index))
+        parts['movie_codes'].append(_intern(tmdb_ids, movie_index))
+        parts['rating'].append(chunk['rating'].to_numpy())
+        parts['timestamp'].append(chunk['timestamp'].to_numpy(np.int64))
+
+    # Nối từng cột rồi giải phóng các mảnh ngay để không giữ hai bản cùng lúc
+    columns = {}
+    for name, dtype in zip(RatingData._fields[2:], (np.int32, np.int32, np.float32, np.int64)):
+        columns[name] = np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dtype)
+        parts[name].clear()
+
+    return RatingData(
+        user_ids=np.asarray(list(user_index), dtype=object),
+        movie_ids=np.fromiter(movie_index, dtype=np.int32, count=len(movie_index)),
+        **columns,
+    )
+
+def build_incidence(data, timestamps=False):
+    """Ma trận liên thuộc user×movie (nhị phân) và ma trận rating (CSR) từ RatingData.
+
+    Nếu một user đánh giá lại cùng một phim thì chỉ giữ rating mới nhất (dòng sau cùng).
+    Với `timestamps=True` trả thêm ma trận timestamp (float64) cho phép chiếu time_decay.
+    """
+    shape = (len(data.user_ids), len(data.movie_ids))
+    keys = data.user_codes.astype(np.int64) * shape[1] + data.movie_codes
+    last = len(keys) - 1 - np.unique(keys[::-1], return_index=True)[1]
+    rows, cols = data.user_codes[last], data.movie_codes[last]
+    rating_matrix = sp.csr_matrix((data.rating[last], (rows, cols)), shape=shape)
+    incidence = sp.csr_matrix((np.ones(len(last), dtype=np.int32), (rows, cols)), shape=shape)
+    if timestamps:
+        return incidence, rating_matrix, sp.csr_matrix((data.timestamp[last].astype(np.float64), (rows, cols)), shape=shape)
+    return incidence, rating_matrix
+
+def rating_columns(data):
+    """Các cột rating theo định dạng của RatingStore (userId là mã trong data.user_ids)."""
+    return {
+        'userId': data.user_codes,
+        'tmdbId': data.movie_ids[data.movie_codes],
+        'rating': data.rating,
+        'timestamp': data.timestamp,
+    }
+
+def read_movies(path, rows=None, chunksize=CHUNK_SIZE):
+    """Đọc metadata phim {tmdbId: movie} theo từng chunk, mỗi phim giữ dòng đầy đủ đầu tiên.
+
+    Chỉ các cột của phim được đọc, và chỉ một lần: tập khoá của kết quả được truyền cho read_ratings để
+    mọi phim có trong rating đều có metadata.
+    """
+    movies = {}
+    chunks = pd.read_csv(path, usecols=MOVIE_COLUMNS, dtype={'tmdbId': 'Int32'}, nrows=rows, chunksize=chunksize)
+    for chunk in chunks:
+        chunk = chunk.dropna()
+        chunk = chunk.astype({'tmdbId': np.int32})
+        chunk = chunk[~chunk['tmdbId'].isin(movies.keys())].drop_duplicates('tmdbId')
+        for movie in chunk[MOVIE_COLUMNS].to_dict(orient='records'):
+            movies[movie['tmdbId']] = movie
+    return movies
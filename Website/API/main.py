@@ -1,9 +1,30 @@
-from fastapi import FastAPI, HTTPException, Request
-from pydantic import BaseModel, confloat
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, confloat, conint
+from bisect import bisect_left
+from functools import partial
+from itertools import islice
+from types import MappingProxyType
+from typing import List, NamedTuple, Optional
+import numpy as np
 import pandas as pd
-import networkx as nx
+import asyncio
+import base64
+import hashlib
+import json
 import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+import API.cache as cache
 import API.community_recommendation as cr
+import API.ingest as ingest
+import API.metrics as metrics
+import API.sparse_graph as sg
+import API.storage as storage
 
 # Khởi tạo logger
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,63 +33,607 @@ logger = logging.getLogger(__name__)
 # Khởi tạo ứng dụng FastAPI
 app = FastAPI()
 
-# Biến lưu trữ dữ liệu trên RAM, reset khi server khởi động lại
-movies = []
-users = []
-ratings = []
+# Ghi lại độ trễ của mỗi request theo mẫu route (không theo URL cụ thể để giới hạn số nhãn)
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.request_latency.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        endpoint=route.path if route is not None else "unmatched",
+        status=response.status_code,
+    )
+    return response
+
+class SingleFlight:
+    """Gộp các lời gọi đồng thời cùng khoá: chỉ lời gọi đầu tiên chạy `fn` (trong threadpool, ngoài
+    event loop), các lời gọi đến sau khi nó chưa xong nhận chung kết quả hoặc ngoại lệ.
+
+    Công việc chạy trong một task riêng không thuộc request nào, nên một request bị huỷ (ví dụ client
+    ngắt kết nối) không làm treo hay huỷ các request khác đang chờ cùng kết quả.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = {}     # {khoá: asyncio.Task}; chỉ được truy cập từ event loop
+
+    async def run(self, key, fn, *args):
+        task = self.calls.get(key)
+        if task is not None:
+            metrics.coalesced_requests.inc(endpoint=self.name)
+        else:
+            task = self.calls[key] = asyncio.ensure_future(run_in_threadpool(fn, *args))
+            task.add_done_callback(partial(self._finished, key))
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            task.exception()  # Đánh dấu đã xử lý nếu mọi request chờ đều đã bị huỷ
+
+class RatingStore:
+    """Bộ đệm rating dạng cột (mảng NumPy) với đường append O(1).
+
+    Phần gốc `base` là các mảng chỉ đọc (có thể được memory-map từ checkpoint), các
+    rating mới được ghi vào phần đuôi cấp phát dư và nhân đôi khi đầy. userId được lưu
+    dạng mã int32 trong `users` (`user_ids` là danh sách userId ứng với các mã của `base`).
+    `to_frame(n)` trả về DataFrame trên n dòng đầu với cột userId kiểu categorical, không
+    chuyển đổi lại từ list các dict.
+    """
+
+    columns = {'userId': np.int32, 'tmdbId': np.int32, 'rating': np.float32, 'timestamp': np.int64}
+
+    def __init__(self, base=None, user_ids=(), capacity=1024):
+        self.base = base or {column: np.empty(0, dtype=dtype) for column, dtype in self.columns.items()}
+        self.users = sg.IdIndex(user_ids)
+        self.base_size = len(self.base['userId'])
+        self.size = 0
+        self.data = {column: np.empty(capacity, dtype=dtype) for column, dtype in self.columns.items()}
+
+    def __len__(self):
+        return self.base_size + self.size
+
+    def append(self, rating):
+        if self.size == len(self.data['userId']):
+            for column, values in self.data.items():
+                grown = np.empty(2 * len(values), dtype=values.dtype)
+                grown[:self.size] = values[:self.size]
+                self.data[column] = grown
+        self.data['userId'][self.size] = self.users.add(rating['userId'])
+        for column in ('tmdbId', 'rating', 'timestamp'):
+            self.data[column][self.size] = rating[column]
+        self.size += 1
+
+    def column(self, column, n=None):
+        n = len(self) if n is None else n
+        if n <= self.base_size:
+            return self.base[column][:n]
+        return np.concatenate([self.base[column], self.data[column][:n - self.base_size]])
+
+    def to_frame(self, n=None):
+        frame = {column: self.column(column, n) for column in self.columns}
+        frame['userId'] = pd.Categorical.from_codes(frame['userId'], categories=pd.Index(self.users.ids, dtype=object))
+        return pd.DataFrame(frame, copy=False)
+
+# Biến lưu trữ dữ liệu trên RAM, được khôi phục từ checkpoint và nhật ký ghi trước khi khởi động lại
+movies = {}             # {tmdbId: movie}
+users = {}              # {userId: user}
+user_records = []       # Danh sách user chỉ thêm vào cuối: đọc theo trang an toàn khi đang có user mới
+ratings = RatingStore()
 recommendations = {}
+graph_core = None       # sg.GraphCore: đồ thị bipartite và đồ thị chiếu trên chỉ số int32, dùng cho cập nhật tăng dần
 algorithms = {
     'girvan_newman': cr.girvan_newman,
     'louvain': cr.louvain,
     'predict_links': cr.predict_links,
     'information_diffusion_ic': cr.information_diffusion_ic,
+    'information_diffusion_ic_celf': partial(cr.information_diffusion_ic, seed_strategy='celf'),
+}
+# Hàm cập nhật tăng dần tương ứng với từng thuật toán
+incremental_updates = {
+    'girvan_newman': cr.update_girvan_newman,
+    'louvain': cr.update_louvain,
+    'predict_links': cr.update_predict_links,
+    'information_diffusion_ic': cr.update_information_diffusion_ic,
+    'information_diffusion_ic_celf': partial(cr.update_information_diffusion_ic, seed_strategy='celf'),
 }
 
-def load_data():
-    n = 200
-    # Đọc dữ liệu từ file csv
-    df = pd.read_csv("../Dataset/Dataset.csv", header=0)[:n]
-    df = df.dropna()
-    
-    global movies, users, ratings
+# Cửa sổ gom các rating mới thành một lô trước khi tính lại (giây)
+RECOMPUTE_WINDOW = float(os.getenv("RECOMPUTE_WINDOW", "1.0"))
+# Chu kỳ tối thiểu giữa hai lần chạy lại toàn bộ của từng thuật toán (giây)
+recompute_intervals = {
+    'girvan_newman': float(os.getenv("GIRVAN_NEWMAN_INTERVAL", "300")),
+    'louvain': float(os.getenv("LOUVAIN_INTERVAL", "30")),
+    'predict_links': float(os.getenv("PREDICT_LINKS_INTERVAL", "60")),
+    'information_diffusion_ic': float(os.getenv("INFORMATION_DIFFUSION_IC_INTERVAL", "60")),
+    'information_diffusion_ic_celf': float(os.getenv("INFORMATION_DIFFUSION_IC_CELF_INTERVAL", "300")),
+}
 
-    # Dữ liệu movies, users, ratings
-    movies_df = df[['tmdbId', 'title', 'poster', 'date_published']].drop_duplicates()
-    movies = movies_df.to_dict(orient='records')
-    
-    users_df = df[['userId']].drop_duplicates()
-    users = users_df.to_dict(orient='records')
+class Snapshot(NamedTuple):
+    """Bản chụp gợi ý bất biến, chỉ được thay thế nguyên khối bởi worker."""
+    version: int
+    created_at: float
+    computed_at: MappingProxyType      # {algorithm: thời điểm chạy lại toàn bộ gần nhất}
+    recommendations: MappingProxyType  # {algorithm: {userId: [tmdbId]}}
+    revisions: MappingProxyType        # {algorithm: {userId: phiên bản snapshot mà danh sách của user thay đổi lần cuối}}
+    fallback: tuple                    # (phim phổ biến nhất, phim phổ biến gần đây) cho user chưa có gợi ý
+
+snapshot = Snapshot(0, time.time(), MappingProxyType({}), MappingProxyType({}), MappingProxyType({}), (cr.RankedMovies(), cr.RankedMovies()))
+published = {}          # {algorithm: bản sao gợi ý trong snapshot hiện tại}, dùng để so sánh khi phát hành bản sau
+revisions = {}          # {algorithm: {userId: revision}}, chỉ được worker cập nhật
+write_queue = []        # Các rating chưa được phản ánh trong snapshot: (thời điểm nhận, rating)
+write_lock = threading.Lock()
+write_event = threading.Event()
+stop_event = threading.Event()
+computed_at = {}        # Thời điểm chạy lại toàn bộ gần nhất của từng thuật toán
+attempted_at = {}       # Thời điểm thử chạy lại gần nhất (kể cả khi lỗi/quá thời gian)
+dirty_algorithms = set() # Thuật toán có dữ liệu mới kể từ lần chạy lại toàn bộ gần nhất
+
+# Số dòng tối đa đọc từ Dataset.csv (0 = toàn bộ)
+DATASET_PATH = os.getenv("DATASET_PATH", "../Dataset/Dataset.csv")
+DATASET_ROWS = int(os.getenv("DATASET_ROWS", "200"))
+
+# Cách tính trọng số đồ thị chiếu user-user (count, cosine, jaccard, time_decay) và tỉa cạnh yếu
+# theo ngưỡng trọng số hoặc số hàng xóm mạnh nhất của mỗi user, trước khi chạy các thuật toán
+projection_options = sg.ProjectionOptions(
+    mode=os.getenv("PROJECTION_MODE", "count"),
+    threshold=float(os.getenv("PROJECTION_THRESHOLD", "0")),
+    top_k=int(os.getenv("PROJECTION_TOP_K", "0")),
+    half_life_days=float(os.getenv("PROJECTION_HALF_LIFE_DAYS", "30")),
+)
+if projection_options.mode not in sg.PROJECTION_MODES:
+    raise ValueError(f"PROJECTION_MODE must be one of {sg.PROJECTION_MODES}, got {projection_options.mode!r}")
+
+# Thư mục chứa nhật ký ghi trước và checkpoint (để trống để chỉ lưu trên RAM)
+DATA_DIR = os.getenv("DATA_DIR", "data")
+# Chu kỳ tối thiểu giữa hai lần ghi checkpoint (giây)
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "300"))
+# Trạng thái của community_recommendation cần cho các cập nhật tăng dần sau khi khởi động lại
+persisted_state = (
+    'link_partners', 'link_followers', 'link_index', 'infected_users', 'seed_sets', 'louvain_partition', 'louvain_touched',
+)
+wal = None
+checkpointed_at = 0.0
+unsaved_changes = False
+restored_projection = None  # (ma trận chiếu, user_ids) đọc từ checkpoint, dùng để dựng lại đồ thị
+
+# Số tiến trình chạy các thuật toán (0 = theo số CPU, < 0 = chạy tuần tự trong tiến trình API). Kể cả
+# với 1 CPU, chạy trong tiến trình riêng giúp luồng phục vụ request không phải tranh GIL với tính toán
+ALGORITHM_WORKERS = int(os.getenv("ALGORITHM_WORKERS", "0")) or min(len(algorithms), os.cpu_count() or 1)
+# Thời gian tối đa (giây) cho mỗi thuật toán khi chạy trong pool; quá hạn thì giữ kết quả cũ
+algorithm_timeouts = {
+    'girvan_newman': float(os.getenv("GIRVAN_NEWMAN_TIMEOUT", "600")),
+    'louvain': float(os.getenv("LOUVAIN_TIMEOUT", "300")),
+    'predict_links': float(os.getenv("PREDICT_LINKS_TIMEOUT", "300")),
+    'information_diffusion_ic': float(os.getenv("INFORMATION_DIFFUSION_IC_TIMEOUT", "300")),
+    'information_diffusion_ic_celf': float(os.getenv("INFORMATION_DIFFUSION_IC_CELF_TIMEOUT", "600")),
+}
+# Trạng thái mà mỗi thuật toán đọc/ghi trong community_recommendation (được gửi kèm sang tiến trình con,
+# ví dụ phân hoạch Louvain trước để khởi tạo); các dict khoá theo chiến lược chọn nguồn IC được gộp,
+# còn lại được thay thế toàn bộ bằng kết quả từ tiến trình con
+algorithm_state = {
+    'louvain': ('louvain_partition', 'louvain_touched'),
+    'predict_links': ('link_partners', 'link_followers', 'link_index'),
+    'information_diffusion_ic': ('infected_users', 'seed_sets'),
+    'information_diffusion_ic_celf': ('infected_users', 'seed_sets'),
+}
+merged_state = ('infected_users', 'seed_sets')
+pool = None
+# forkserver: tiến trình con không kế thừa các thread và lock của server API
+pool_context = multiprocessing.get_context("forkserver")
+pool_context.set_forkserver_preload(["API.main"])
 
-    ratings_df = df[['userId', 'tmdbId', 'rating', 'timestamp']]
-    ratings = ratings_df.to_dict(orient='records')
+# Gợi ý dự phòng cho user chưa có gợi ý của thuật toán (user mới, hoặc chưa được thuật toán xét tới):
+# danh sách top phim của cộng đồng mà user được gán vào ngay sau rating đầu tiên, theo thứ tự các thuật
+# toán cộng đồng dưới đây; nếu chưa thuộc cộng đồng nào thì dùng bảng xếp hạng FALLBACK_RANKING
+# ("trending" = phổ biến gần đây theo timestamp, "popular" = tổng số lượt đánh giá)
+fallback_communities = ('louvain', 'girvan_newman')
+FALLBACK_RANKING = os.getenv("FALLBACK_RANKING", "trending")
+if FALLBACK_RANKING not in ("popular", "trending"):
+    raise ValueError(f"FALLBACK_RANKING must be 'popular' or 'trending', got {FALLBACK_RANKING!r}")
+
+# Cache phản hồi gợi ý đã serialize: số cặp (user, thuật toán) tối đa (0 = tắt) và thời gian sống (giây)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+response_cache = cache.ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+# Phiên bản dữ liệu của từng danh sách, dùng làm khoá ETag; boot_id thay đổi mỗi lần khởi động
+boot_id = uuid.uuid4().hex[:8]
+data_versions = {'movies': 0, 'users': 0}
+movie_titles = None     # [(tiêu đề viết thường, tmdbId)] đã sắp xếp, dùng cho lọc theo tiền tố tiêu đề
+
+def load_data():
+    """Nạp rating theo từng chunk (chỉ các cột cần thiết) và trả về phép chiếu user-user dựng sẵn."""
+    global movies, users, user_records, ratings
+    n = DATASET_ROWS or None
+    # Metadata phim (title, poster, ...) được đọc một lượt riêng; chỉ giữ rating của phim có metadata
+    catalogue = ingest.read_movies(DATASET_PATH, rows=n)
+    data = ingest.read_ratings(DATASET_PATH, rows=n, movie_ids=catalogue.keys())
+    movies = {tmdb_id: catalogue[tmdb_id] for tmdb_id in data.movie_ids.tolist()}
+    users = {user: {'userId': user} for user in data.user_ids.tolist()}
+    user_records = list(users.values())
+    ratings = RatingStore(base=ingest.rating_columns(data), user_ids=data.user_ids.tolist())
+
+    index_movies()
 
     logger.info(f"Current numbers of users: {len(users)}")
     logger.info(f"Current numbers of ratings: {len(ratings)}")
+    # Ma trận liên thuộc và phép chiếu B·Bᵀ được dựng ở đây nên được đo như stage "projection"
+    with metrics.stage("projection") as result:
+        incidence, rating_matrix, *timestamps = ingest.build_incidence(data, projection_options.mode == "time_decay")
+        user_movie = sg.UserProjection.from_matrices(
+            incidence, rating_matrix, data.user_ids, data.movie_ids,
+            timestamp_matrix=timestamps[0] if timestamps else None, options=projection_options,
+        )
+        result.output_size = user_movie.number_of_edges()
+    return user_movie
 
-def get_recommendations(ratings, algorithms):
-    # Tạo đồ thị
-    B = nx.Graph()
-    ratings = pd.DataFrame(ratings)
+def index_movies():
+    # Chỉ mục tiêu đề được dựng lại ở lần lọc theo tiền tố tiếp theo
+    global movie_titles
+    movie_titles = None
+    data_versions['movies'] += 1
 
-    user_ids = ratings['userId'].unique()
-    movie_ids = ratings['tmdbId'].unique()
-    edges = list(zip(ratings['userId'], ratings['tmdbId']))
+def title_index():
+    # Chỉ mục tiêu đề đã sắp xếp để lọc theo tiền tố bằng tìm kiếm nhị phân
+    global movie_titles
+    if movie_titles is None:
+        movie_titles = sorted((str(movie['title']).lower(), tmdb_id) for tmdb_id, movie in movies.items())
+    return movie_titles
+
+def state_projection_options(state):
+    # Checkpoint cũ không ghi cấu hình chiếu: khi đó ma trận đã lưu là số phim chung
+    return sg.ProjectionOptions(**state.get('projection_options', {}))
+
+def restore_data():
+    # Khôi phục dữ liệu và gợi ý từ checkpoint gần nhất (các mảng rating được memory-map)
+    checkpoint = storage.load_checkpoint(DATA_DIR)
+    if checkpoint is None:
+        return None
+
+    global movies, users, user_records, ratings, restored_projection
+    movies = {movie['tmdbId']: movie for movie in checkpoint['movies']}
+    users = {user['userId']: user for user in checkpoint['users']}
+    user_records = list(users.values())
+    ratings = RatingStore(base=checkpoint['ratings'], user_ids=checkpoint['rating_users'])
+    # Ma trận chiếu đã lưu chỉ dùng lại được nếu được tính với cùng cấu hình chiếu
+    if state_projection_options(checkpoint['state']) == projection_options:
+        restored_projection = checkpoint['projection']
+    else:
+        restored_projection = (None, checkpoint['projection'][1])
+    index_movies()
+
+    state = checkpoint['state']
+    recommendations.update(state['recommendations'])
+    computed_at.update(state['computed_at'])
+    attempted_at.update(state['computed_at'])
+    # Thuật toán mới được cấu hình sau checkpoint sẽ được worker chạy ngay
+    dirty_algorithms.update(algo for algo in algorithms if algo not in recommendations)
+    for name, value in state['cr'].items():
+        getattr(cr, name).clear()
+        getattr(cr, name).update(value)
+
+    logger.info(f"Restored checkpoint with {len(ratings)} ratings")
+    return checkpoint
+
+def add_user_record(record):
+    # Thêm vào danh sách trước rồi mới vào dict: request đọc không bao giờ thấy user chưa có trong danh sách
+    user_records.append(record)
+    users[record['userId']] = record
+    data_versions['users'] += 1
+
+def replay_log(offset):
+    # Áp dụng lại các user/rating ghi sau checkpoint; rating được đưa vào hàng đợi của worker
+    entries = wal.read_from(offset)
+    for entry in entries:
+        record = entry['record']
+        if entry['type'] == 'user':
+            add_user_record(record)
+        elif entry['type'] == 'rating':
+            ratings.append(record)
+            write_queue.append((time.time(), record))
+    if write_queue:
+        write_event.set()
+    logger.info(f"Replayed {len(entries)} log entries")
 
-    B.add_nodes_from(user_ids, bipartite=0)  # Nhóm người dùng
-    B.add_nodes_from(movie_ids, bipartite=1)  # Nhóm phim
-    B.add_edges_from(edges)
+def write_checkpoint(applied, wal_offset, users_snapshot):
+    frame = ratings.to_frame(applied)
+    state = {
+        'recommendations': recommendations,
+        'computed_at': computed_at,
+        'cr': {name: getattr(cr, name) for name in persisted_state},
+        'projection_options': projection_options._asdict(),
+    }
+    projection = sg.UserProjection(frame, projection_options)
+    storage.save_checkpoint(DATA_DIR, frame, users_snapshot, movies, projection, state, wal_offset)
+    # Các bản ghi trước wal_offset đã nằm trong checkpoint: bắt đầu đoạn nhật ký mới từ đó
+    with write_lock:
+        wal.rotate(wal_offset)
+    logger.info(f"Wrote checkpoint with {applied} ratings")
 
-    user_movie = nx.bipartite.weighted_projected_graph(B, user_ids)
+def projection_patchable():
+    # Chỉ đồ thị đếm phim chung chưa tỉa mới vá tăng dần đúng được (xem sg.GraphCore)
+    return projection_options.mode == "count" and not projection_options.threshold and not projection_options.top_k
+
+def build_graph_core(user_movie):
+    # Đồ thị dùng cho cập nhật tăng dần, dựng từ phép chiếu của lần tính lại toàn bộ
+    global graph_core
+    with metrics.stage("graph_core"):
+        graph_core = sg.GraphCore(user_movie, patch_projection=projection_patchable())
+    metrics.record_graph("bipartite", len(graph_core.users) + len(graph_core.movies), graph_core.number_of_ratings)
+
+def restored_user_movie(frame):
+    # Dùng lại ma trận chiếu đã lưu trong checkpoint nếu thứ tự user khớp, tránh tính lại B @ B.T
+    frame = frame.drop_duplicates(['userId', 'tmdbId'], keep='last')
+    incidence, user_ids, movie_ids = sg.build_incidence(frame)
+    weights, projection_ids = restored_projection
+    if list(projection_ids) != user_ids.tolist():
+        weights = None
+    timestamps = None
+    if weights is None and projection_options.mode == "time_decay":
+        timestamps = sg.build_incidence(frame, 'timestamp', np.float64)[0]
+    return sg.UserProjection.from_matrices(
+        incidence, sg.build_incidence(frame, 'rating')[0], user_ids, movie_ids, weights,
+        timestamp_matrix=timestamps, options=projection_options,
+    )
+
+def get_recommendations(ratings, algorithms, user_movie=None):
+    edges = list(zip(ratings['userId'], ratings['tmdbId']))
+
+    # Đồ thị chiếu user-user tính bằng tích ma trận thưa theo projection_options; nếu bộ nạp đã dựng sẵn
+    # thì stage "projection" đã được đo trong load_data
+    if user_movie is None:
+        with metrics.stage("projection") as result:
+            user_movie = sg.UserProjection(ratings, projection_options)
+            result.output_size = user_movie.number_of_edges()
+    metrics.record_graph("user_user", user_movie.number_of_nodes(), user_movie.number_of_edges())
 
     # Tính toán gợi ý dựa trên các thuật toán công đồng
     global recommendations
-    for algo in algorithms:
+    build_graph_core(user_movie)
+    if ALGORITHM_WORKERS > 0:
+        outcomes = run_algorithms_in_pool(user_movie, algorithms)
+    else:
+        outcomes = {}
+        for algo in algorithms:
+            try:
+                with metrics.stage(f"algorithm:{algo}"):
+                    outcomes[algo] = (algorithms[algo](user_movie, edges), None)
+            except Exception as e:
+                outcomes[algo] = e
+
+    for algo, outcome in outcomes.items():
+        attempted_at[algo] = time.time()
+        if isinstance(outcome, Exception):
+            # Giữ lại kết quả của lần chạy trước nếu thuật toán lỗi hoặc quá thời gian
+            logger.error(f"Error running {algo} algorithm: {outcome}")
+            recommendations.setdefault(algo, None)
+            continue
+        recommendations[algo], state = outcome
+        if state is not None:
+            for name, value in state.items():
+                target = getattr(cr, name)
+                if name not in merged_state:
+                    target.clear()
+                target.update(value)
+        metrics.stage_output_size.set(len(recommendations[algo]), stage=f"algorithm:{algo}")
+        computed_at[algo] = time.time()
+        dirty_algorithms.discard(algo)
+        logger.info(f"Finished running {algo} algorithm")
+
+def run_algorithm(algo, shared, state):
+    """Chạy một thuật toán trong tiến trình con trên phép chiếu đọc từ shared memory.
+
+    `state` là trạng thái community_recommendation hiện tại của thuật toán ở tiến trình API.
+    Trả về (gợi ý, trạng thái community_recommendation mà thuật toán đã ghi, các phép đo stage
+    trong tiến trình con để tiến trình cha ghi vào metrics).
+    """
+    # Pool đã chạy song song các thuật toán nên không tạo thêm tiến trình cho mô phỏng IC
+    cr.ic_processes = 1
+    for name in persisted_state:
+        getattr(cr, name).clear()
+        if name in state:
+            getattr(cr, name).update(state[name])
+    user_movie = sg.UserProjection.from_shared(shared)
+    with metrics.recording() as measurements:
+        user_recommendations = algorithms[algo](user_movie, user_movie.edges())
+    return user_recommendations, {name: getattr(cr, name) for name in algorithm_state.get(algo, ())}, measurements
+
+def run_algorithms_in_pool(user_movie, algorithms):
+    """Chạy song song các thuật toán trong pool tiến trình; trả về {algo: (gợi ý, trạng thái) hoặc Exception}."""
+    global pool
+    shared, blocks = user_movie.to_shared()
+    try:
+        if pool is None:
+            pool = pool_context.Pool(ALGORITHM_WORKERS)
+        start = time.monotonic()
+        pending = {
+            algo: pool.apply_async(run_algorithm, (algo, shared, {name: getattr(cr, name) for name in algorithm_state.get(algo, ())}))
+            for algo in algorithms
+        }
+
+        outcomes, timed_out = {}, False
+        finished = start
+        for position, (algo, result) in enumerate(pending.items()):
+            # Hạn chót tính từ lúc thuật toán bắt đầu chạy: ngay khi gửi nếu còn tiến trình rảnh,
+            # nếu không thì xấp xỉ bằng lúc thuật toán gửi trước nó xong
+            began = start if position < ALGORITHM_WORKERS else finished
+            try:
+                outcomes[algo] = result.get(timeout=max(0.0, began + algorithm_timeouts[algo] - time.monotonic()))
+            except multiprocessing.TimeoutError:
+                outcomes[algo] = TimeoutError(f"timed out after {algorithm_timeouts[algo]:.0f}s")
+                timed_out = True
+            except Exception as e:
+                outcomes[algo] = e
+            if isinstance(outcomes[algo], Exception):
+                metrics.stage_errors.inc(stage=f"algorithm:{algo}")
+            else:
+                user_recommendations, state, measurements = outcomes[algo]
+                outcomes[algo] = (user_recommendations, state)
+                metrics.replay(measurements)
+                metrics.record_stage(f"algorithm:{algo}", time.monotonic() - began)
+            finished = time.monotonic()
+
+        if timed_out:
+            # Không thể huỷ riêng một tác vụ đang chạy: dừng cả pool, lần sau sẽ tạo pool mới
+            pool.terminate()
+            pool = None
+        return outcomes
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+def update_recommendations(user, movie, rating, timestamp):
+    # Vá đồ thị chiếu user-user cho cạnh mới thay vì xây dựng lại toàn bộ
+    affected = cr.add_rating_edge(graph_core, user, movie, rating)
+    if not affected:
+        return
+    cr.popularity.add(movie, timestamp)
+
+    # Chỉ cập nhật gợi ý của các user/cộng đồng bị ảnh hưởng
+    for algo in incremental_updates:
+        if recommendations.get(algo) is None:
+            continue
         try:
-            recommendations[algo] = algorithms[algo](user_movie, edges)
-            logger.info(f"Finished running {algo} algorithm")
+            incremental_updates[algo](graph_core, user, movie, affected, recommendations[algo])
         except Exception as e:
-            logger.error(f"Error running {algo} algorithm: {e}")
-            recommendations[algo] = None 
+            logger.error(f"Error updating {algo} algorithm: {e}")
+    logger.info(f"Updated recommendations for {len(affected)} affected users")
+
+def changed_users(previous, current):
+    """Các user có danh sách gợi ý khác nhau giữa hai kết quả của cùng một thuật toán."""
+    if previous is None:
+        return set(current)
+    if isinstance(current, cr.CommunityRecommendations) and isinstance(previous, cr.CommunityRecommendations):
+        return current.changed_users(previous)
+    changed = {user for user in previous if user not in current}
+    for user, recommended in current.items():
+        old = previous.get(user)
+        if old is not recommended and old != recommended:
+            changed.add(user)
+    return changed
+
+def publish_snapshot():
+    # Sao chép nông để snapshot cũ không bị ảnh hưởng bởi các cập nhật tăng dần sau đó
+    global snapshot
+    version = snapshot.version + 1
+    changes = {}
+    for algo, recs in recommendations.items():
+        if recs is None:
+            continue
+        # Chỉ tăng revision của các user có danh sách thay đổi, cache của user khác vẫn dùng được
+        recs = recs.copy()
+        changes[algo] = changed_users(published.get(algo), recs)
+        algo_revisions = revisions.setdefault(algo, {})
+        for user in changes[algo]:
+            if user in recs:
+                algo_revisions[user] = version
+            else:
+                algo_revisions.pop(user, None)
+        published[algo] = recs
+
+    snapshot = Snapshot(
+        version=version,
+        created_at=time.time(),
+        computed_at=MappingProxyType(dict(computed_at)),
+        recommendations=MappingProxyType({
+            algo: None if algo not in published else MappingProxyType(published[algo])
+            for algo in recommendations
+        }),
+        revisions=MappingProxyType({algo: MappingProxyType(dict(revisions[algo])) for algo in published}),
+        fallback=cr.popularity.ranking(),
+    )
+    # Các mục cũ đã không còn khớp revision mới; xoá sớm để nhường chỗ trong cache
+    invalidated = sum(response_cache.invalidate(algo, users) for algo, users in changes.items())
+    logger.info(
+        f"Published recommendation snapshot v{snapshot.version} "
+        f"({sum(map(len, changes.values()))} changed recommendation lists, {invalidated} cached responses invalidated)"
+    )
+
+def recompute_worker():
+    """Gom các rating mới theo cửa sổ RECOMPUTE_WINDOW và tính lại gợi ý ngoài request handler."""
+    while not stop_event.is_set():
+        # Thức dậy định kỳ để chạy các thuật toán đến hạn dù không có rating mới
+        if write_event.wait(timeout=1.0):
+            time.sleep(RECOMPUTE_WINDOW)
+        try:
+            refresh_snapshot()
+        except Exception as e:
+            # Lô rating vẫn nằm trong hàng đợi và được thử lại ở vòng sau; snapshot cũ tiếp tục được phục vụ
+            logger.exception(f"Error refreshing recommendations: {e}")
+            metrics.stage_errors.inc(stage="recompute_worker")
+
+def refresh_snapshot():
+    """Một vòng của worker: áp dụng lô rating đang chờ, chạy lại các thuật toán đến hạn, phát hành
+    snapshot mới và ghi checkpoint khi đến hạn. Lô chỉ được xoá khỏi hàng đợi sau khi đã phát hành."""
+    global checkpointed_at, unsaved_changes, restored_projection
+
+    # Sau khi khôi phục từ checkpoint, dựng lại đồ thị cho cập nhật tăng dần mà không chạy lại thuật toán
+    if restored_projection is not None:
+        with write_lock:
+            applied = ratings.base_size
+        build_graph_core(restored_user_movie(ratings.to_frame(applied)))
+        restored_projection = None
+
+    checkpoint_due = wal is not None and time.time() - checkpointed_at >= CHECKPOINT_INTERVAL
+    with write_lock:
+        write_event.clear()
+        batch = list(write_queue)
+        applied = len(ratings)
+        if checkpoint_due:
+            wal_offset, users_snapshot = wal.offset, dict(users)
+
+    # Áp dụng lại một rating đã có trong đồ thị (khi thử lại lô) không thay đổi gì
+    changed = False
+    for _, rating in batch:
+        try:
+            with metrics.stage("incremental_update", trace_memory=False):
+                update_recommendations(rating['userId'], rating['tmdbId'], rating['rating'], rating['timestamp'])
+        except Exception as e:
+            logger.error(f"Error applying rating {rating}: {e}")
+    if batch:
+        dirty_algorithms.update(algorithms)
+        changed = True
+
+    now = time.time()
+    due = {
+        algo: algorithms[algo]
+        for algo in dirty_algorithms
+        if now - attempted_at.get(algo, 0) >= recompute_intervals[algo]
+    }
+    if due:
+        # Ghi nhận lần thử trước khi chạy để một lỗi (ví dụ không tạo được pool) không bị thử lại liên tục
+        for algo in due:
+            attempted_at[algo] = now
+        get_recommendations(ratings.to_frame(applied), due)
+        changed = True
+
+    if changed:
+        with metrics.stage("publish_snapshot", trace_memory=False):
+            publish_snapshot()
+        with write_lock:
+            del write_queue[:len(batch)]
+        unsaved_changes = True
+
+    if checkpoint_due and unsaved_changes:
+        try:
+            with metrics.stage("checkpoint", trace_memory=False):
+                write_checkpoint(applied, wal_offset, users_snapshot)
+            checkpointed_at, unsaved_changes = time.time(), False
+        except Exception as e:
+            logger.error(f"Error writing checkpoint: {e}")
+
+def staleness():
+    # Thời gian rating cũ nhất chưa được phản ánh trong snapshot đã chờ. Không lấy write_lock vì hàm
+    # được gọi trong handler async (lock có thể đang được giữ trong lúc fsync nhật ký)
+    try:
+        return time.time() - write_queue[0][0]
+    except IndexError:
+        return 0.0
 
 # Models
 class Movie(BaseModel):
@@ -87,30 +652,139 @@ class Rating(BaseModel):
     rating: confloat(ge=0.5, le=5.0, multiple_of=0.5)
     timestamp: int
 
+class BatchRecommendationRequest(BaseModel):
+    userIds: List[str]
+    algorithms: Optional[List[str]] = None  # Mặc định: tất cả thuật toán
+    limit: Optional[conint(ge=1)] = None    # Số phim tối đa cho mỗi (user, thuật toán)
+
 # Load dữ liệu khi khởi động ứng dụng
 @app.on_event("startup")
 def startup_event():
-    load_data()
-    get_recommendations(ratings, algorithms)
+    global wal, unsaved_changes
+    checkpoint = restore_data() if DATA_DIR else None
+    if checkpoint is None:
+        user_movie = load_data()
+        get_recommendations(ratings.to_frame(), algorithms, user_movie)
+        unsaved_changes = True
+    # Bảng xếp hạng dự phòng tính từ các rating đã áp dụng; rating trong nhật ký được worker cộng dần
+    cr.popularity.build(ratings.to_frame())
+
+    if DATA_DIR:
+        wal = storage.WriteAheadLog(os.path.join(DATA_DIR, "ratings.log"))
+        replay_log(checkpoint['wal_offset'] if checkpoint else 0)
+    publish_snapshot()
+    threading.Thread(target=recompute_worker, name="recompute-worker", daemon=True).start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    stop_event.set()
+    write_event.set()
+    if wal is not None:
+        wal.close()
+    if pool is not None:
+        pool.terminate()
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(str(position).encode()).decode()
+
+def decode_cursor(cursor):
+    if not cursor:
+        return 0
+    try:
+        position = int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if position < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+def list_response(request, collection, records, next_position, fields):
+    """Trả về một trang dữ liệu kèm ETag; trả 304 nếu client đã có đúng phiên bản này."""
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.items()))
+    etag = '"' + hashlib.sha1(f"{collection}:{boot_id}:{data_versions[collection]}:{query}".encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    if fields:
+        records = [{field: record[field] for field in fields if field in record} for record in records]
+    content = {collection: records, "next_cursor": encode_cursor(next_position) if next_position is not None else None}
+    return JSONResponse(content, headers=headers)
+
+def paginate(items, start, limit, predicate=None):
+    # Duyệt từ vị trí `start`, trả về (các phần tử khớp, vị trí bắt đầu trang kế tiếp hoặc None)
+    page = []
+    position = start
+    for position, item in enumerate(islice(items, start, None), start):
+        if limit is not None and len(page) == limit:
+            return page, position
+        if predicate is None or predicate(item):
+            page.append(item)
+    return page, None
 
-# Endpoint: Lấy danh sách phim
+def parse_fields(fields, allowed):
+    if not fields:
+        return None
+    fields = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return fields
+
+# Endpoint: Lấy danh sách phim (phân trang theo cursor, lọc theo id/tiền tố tiêu đề, chọn trường)
 @app.get("/movies")
-def get_movies():
-    return {"movies": movies}
+def get_movies(request: Request, limit: Optional[int] = Query(None, ge=1), cursor: str = None, fields: str = None,
+               ids: str = None, prefix: str = None):
+    fields = parse_fields(fields, ['tmdbId', 'title', 'poster', 'date_published'])
+    start = decode_cursor(cursor)
+
+    if ids:
+        try:
+            wanted = [int(tmdb_id) for tmdb_id in ids.split(",") if tmdb_id.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid movie ID")
+        found = [movies[tmdb_id] for tmdb_id in wanted if tmdb_id in movies]
+        records, next_position = paginate(found, start, limit)
+    elif prefix:
+        # Các tiêu đề cùng tiền tố nằm liên tiếp trong chỉ mục đã sắp xếp
+        prefix = prefix.lower()
+        titles = title_index()
+        first = bisect_left(titles, (prefix,))
+        last = bisect_left(titles, (prefix + "\uffff",))
+        records, next_position = paginate(titles[first:last], start, limit)
+        records = [movies[tmdb_id] for _, tmdb_id in records]
+    else:
+        records, next_position = paginate(movies.values(), start, limit)
+
+    return list_response(request, "movies", records, next_position, fields)
 
-# Endpoint: Lấy danh sách người dùng
+# Endpoint: Lấy danh sách người dùng (phân trang theo cursor, lọc theo id/tiền tố userId)
 @app.get("/users")
-def get_users():
-    return {"users": users}
+def get_users(request: Request, limit: Optional[int] = Query(None, ge=1), cursor: str = None, fields: str = None,
+              ids: str = None, prefix: str = None):
+    fields = parse_fields(fields, ['userId'])
+    start = decode_cursor(cursor)
+
+    if ids:
+        found = [users[user_id] for user_id in ids.split(",") if user_id in users]
+        records, next_position = paginate(found, start, limit)
+    else:
+        predicate = (lambda user: user['userId'].startswith(prefix)) if prefix else None
+        records, next_position = paginate(user_records, start, limit, predicate)
+
+    return list_response(request, "users", records, next_position, fields)
 
 # Endpoint: Thêm người dùng mới
 @app.post("/add_user")
 def add_user(user: User):
-    global users
-    if any(u['userId'] == user.userId for u in users):
-        logger.error(f"User {user.userId} already exists")
-        raise HTTPException(status_code=400, detail="User already exists")
-    users.append(user.dict())
+    with write_lock:
+        # Kiểm tra trong lock để hai request đồng thời không cùng thêm một user
+        if user.userId in users:
+            logger.error(f"User {user.userId} already exists")
+            raise HTTPException(status_code=400, detail="User already exists")
+        if wal is not None:
+            wal.append({'type': 'user', 'record': user.dict()})
+        add_user_record(user.dict())
 
     logger.info(f"User {user.userId} added successfully")
     logger.info(f"Current numbers of users: {len(users)}")
@@ -120,38 +794,203 @@ def add_user(user: User):
 # Endpoint: Thêm đánh giá
 @app.post("/add_rating/")
 def add_rating(rating: Rating):
-    global ratings
     # Kiểm tra user_id có trong danh sách users không
-    if not any(u['userId'] == rating.userId for u in users):
+    if rating.userId not in users:
         raise HTTPException(status_code=400, detail="Invalid user ID")
     
     # Kiểm tra tmdb_id có trong danh sách movies không
-    if not any(m['tmdbId'] == rating.tmdbId for m in movies):
+    if rating.tmdbId not in movies:
         raise HTTPException(status_code=400, detail="Invalid movie ID")
     
-    # Thêm rating mới vào danh sách ratings
-    ratings.append(rating.dict())
+    # Thêm rating mới vào danh sách ratings, việc tính lại gợi ý do worker đảm nhận
+    with write_lock:
+        if wal is not None:
+            wal.append({'type': 'rating', 'record': rating.dict()})
+        ratings.append(rating.dict())
+        write_queue.append((time.time(), rating.dict()))
+    write_event.set()
     logger.info(f"Current numbers of ratings: {len(ratings)}")
 
-    get_recommendations(ratings, algorithms)
+    return {"message": "Rating added successfully", "snapshot_version": snapshot.version}
 
-    return {"message": "Rating added successfully"}
+# Endpoint: Trạng thái snapshot gợi ý hiện tại
+@app.get("/recommendations/snapshot")
+async def get_snapshot():
+    current = snapshot
+    return {
+        "version": current.version,
+        "created_at": current.created_at,
+        "computed_at": dict(current.computed_at),
+        "pending_ratings": len(write_queue),
+        "staleness": staleness(),
+        # Khoá cache phía client: thay đổi khi server khởi động lại hoặc danh sách user/phim thay đổi
+        "boot_id": boot_id,
+        "data_versions": dict(data_versions),
+    }
 
-@app.get("/recommendations/{userId}/{algorithm}")
-async def recommend_movies(userId: str, algorithm: str):
+# Các request giống nhau đến cùng lúc (cùng snapshot) chỉ được xử lý một lần
+recommendation_flights = SingleFlight("recommendations")
+batch_flights = SingleFlight("recommendations_batch")
+
+def snapshot_headers(current):
+    return {"X-Snapshot-Version": str(current.version), "X-Snapshot-Staleness": f"{staleness():.3f}"}
+
+def to_json(value):
+    # Giống JSONResponse.render, dùng để ghép phản hồi từ các mảnh đã cache
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def revision_of(current, userId, algorithm):
+    algo_revisions = current.revisions.get(algorithm)
+    return None if algo_revisions is None else algo_revisions.get(userId)
+
+def fallback_recommendations(current, userId, algorithm):
+    """(danh sách tmdbId, nguồn) dự phòng cho user đã tồn tại nhưng chưa có gợi ý của `algorithm`."""
+    for name in fallback_communities:
+        community_recommendations = current.recommendations.get(name)
+        if name != algorithm and community_recommendations is not None and userId in community_recommendations:
+            recommended = community_recommendations[userId]
+            if recommended:
+                return recommended, f"community:{name}"
+    popular, trending = current.fallback
+    ranking = trending if FALLBACK_RANKING == "trending" else popular
+    # Bảng xếp hạng chung: bỏ các phim user đã đánh giá (đã áp dụng vào đồ thị bipartite)
+    core = graph_core
+    watched = core.movie_ratings(userId) if core is not None else {}
+    return ranking.without(watched).head(cr.top_n), FALLBACK_RANKING
+
+def render_recommendations(current, userId, algorithm):
     # Kiểm tra xem thuật toán có tồn tại trong recommendations không
-    if algorithm not in recommendations:
+    if algorithm not in current.recommendations:
         raise HTTPException(status_code=404, detail=f"Algorithm '{algorithm}' not found.")
 
     # Lấy danh sách gợi ý của thuật toán
-    user_recommendations = recommendations[algorithm]
+    user_recommendations = current.recommendations[algorithm]
+    if user_recommendations is None:
+        raise HTTPException(status_code=503, detail=f"Algorithm '{algorithm}' is not available.")
 
     # Kiểm tra nếu userId có trong gợi ý
-    if userId not in user_recommendations:
+    revision = revision_of(current, userId, algorithm)
+    recommended = None if revision is None else user_recommendations[userId]
+    if recommended:
+        body = to_json(recommended)
+        response_cache.put(userId, algorithm, "ids", revision, body)
+        return body, None
+
+    # User đã tồn tại nhưng thuật toán chưa có gợi ý cho họ (ví dụ user mới): trả về gợi ý dự phòng
+    if userId not in users:
         raise HTTPException(status_code=404, detail=f"No recommendations found for userId '{userId}'.")
+    recommended, source = fallback_recommendations(current, userId, algorithm)
+    return to_json(recommended), source
+
+@app.get("/recommendations/{userId}/{algorithm}")
+async def recommend_movies(userId: str, algorithm: str):
+    # Đọc từ một snapshot duy nhất (không lấy lock) để tránh đọc dở dang khi worker đang cập nhật
+    current = snapshot
+    headers = snapshot_headers(current)
+    revision = revision_of(current, userId, algorithm)
+    body = None if revision is None else response_cache.get(userId, algorithm, "ids", revision)
+    source = None
+    if body is None:
+        try:
+            body, source = await recommendation_flights.run(
+                (current.version, userId, algorithm), render_recommendations, current, userId, algorithm
+            )
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail, headers=headers)
+    if source is not None:
+        headers["X-Recommendation-Fallback"] = source
+    return Response(body, media_type="application/json", headers=headers)
+
+
+MAX_BATCH_USERS = int(os.getenv("MAX_BATCH_USERS", "5000"))
+
+def hydrate(recommended, limit=None):
+    """Ghép tmdbId với thông tin phim và điểm của thuật toán (cr.RankedMovies.scores): tổng trọng số liên kết
+    (predict_links), số user bị lây nhiễm đã xem (IC), số thành viên cộng đồng đã xem (girvan_newman, louvain),
+    hoặc độ phổ biến với gợi ý dự phòng. score là None nếu danh sách không có điểm (checkpoint cũ)."""
+    scores = getattr(recommended, "scores", None)
+    records = []
+    for rank, tmdb_id in enumerate(islice(recommended, limit), 1):
+        movie = movies.get(tmdb_id)
+        if movie is None:
+            continue
+        records.append({
+            "rank": rank,
+            "score": None if scores is None else round(float(scores[rank - 1]), 6),
+            "tmdbId": tmdb_id,
+            "title": movie["title"],
+            "poster": movie["poster"],
+            "date_published": movie["date_published"],
+        })
+    return records
+
+def render_batch(current, user_ids, algorithm_names, limit):
+    unknown = [name for name in algorithm_names if name not in current.recommendations]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Algorithm(s) not found: {', '.join(unknown)}")
+    unavailable = [name for name in algorithm_names if current.recommendations[name] is None]
+
+    # Danh sách phim của từng (user, thuật toán) được serialize riêng và cache theo `limit`,
+    # rồi ghép thành phản hồi mà không phải serialize lại các mảnh đã có
+    # User đã tồn tại nhưng chưa có gợi ý của một thuật toán nhận gợi ý dự phòng (không cache),
+    # nguồn được ghi trong "fallback": {userId: {thuật toán: nguồn}}
+    variant = ("movies", limit)
+    results = []
+    not_found = []
+    fallback = {}
+    for user_id in user_ids:
+        parts = []
+        for name in algorithm_names:
+            if name in unavailable:
+                continue
+            revision = revision_of(current, user_id, name)
+            fragment = None if revision is None else response_cache.get(user_id, name, variant, revision)
+            if fragment is None:
+                recommended = None if revision is None else current.recommendations[name][user_id]
+                if recommended:
+                    fragment = to_json(hydrate(recommended, limit))
+                    response_cache.put(user_id, name, variant, revision, fragment)
+                elif user_id in users:
+                    recommended, fallback.setdefault(user_id, {})[name] = fallback_recommendations(current, user_id, name)
+                    fragment = to_json(hydrate(recommended, limit))
+                else:
+                    continue
+            parts.append(to_json(name) + b":" + fragment)
+        if parts:
+            results.append(to_json(user_id) + b":{" + b",".join(parts) + b"}")
+        else:
+            not_found.append(user_id)
+
+    return b'{"snapshot_version":%d,"results":{%s},"not_found":%s,"unavailable":%s,"fallback":%s}' % (
+        current.version, b",".join(results), to_json(not_found), to_json(unavailable), to_json(fallback),
+    )
+
+# Endpoint: Gợi ý cho nhiều user và nhiều thuật toán trong một lần gọi
+@app.post("/recommendations/batch")
+async def recommend_movies_batch(request: BatchRecommendationRequest):
+    if len(request.userIds) > MAX_BATCH_USERS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_USERS} users per request.")
 
-    return user_recommendations[userId]
+    current = snapshot
+    headers = snapshot_headers(current)
+    user_ids = tuple(dict.fromkeys(request.userIds))
+    algorithm_names = tuple(request.algorithms or current.recommendations)
+    # Ghép hydrate cho nhiều user chạy trong threadpool để không chặn event loop
+    try:
+        body = await batch_flights.run(
+            (current.version, user_ids, algorithm_names, request.limit),
+            render_batch, current, user_ids, algorithm_names, request.limit,
+        )
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
+# Endpoint: Metrics dạng văn bản Prometheus
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    metrics.pending_ratings.set(len(write_queue))
+    metrics.snapshot_version.set(snapshot.version)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # Chạy server
 if __name__ == "__main__":
@@ -0,0 +1,196 @@
+# metrics.py
+import cProfile
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Cấu hình qua biến môi trường
+# Đo bộ nhớ đỉnh bằng tracemalloc trong mỗi stage; tắt mặc định vì làm chậm tính toán khoảng 5 lần
+TRACE_MEMORY = os.getenv("METRICS_TRACE_MEMORY", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR") or None                  # Nếu đặt, ghi file cProfile cho mỗi stage vào thư mục này
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+
+_lock = threading.Lock()
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+class Metric:
+    """Một metric Prometheus với các giá trị theo bộ nhãn (counter hoặc gauge)."""
+
+    def __init__(self, name, help, kind):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.values = {}
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+class Histogram(Metric):
+    """Histogram Prometheus với các bucket cố định (luỹ tiến, kèm _sum và _count)."""
+
+    def __init__(self, name, help, buckets):
+        super().__init__(name, help, "histogram")
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (value <= bound) for c, bound in zip(counts, self.buckets)]
+            self.values[key] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.values.items()):
+            for bound, c in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', bound),))} {c}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+registry = []
+
+def _register(metric):
+    registry.append(metric)
+    return metric
+
+request_latency = _register(Histogram("http_request_duration_seconds", "Request latency by endpoint.", LATENCY_BUCKETS))
+stage_duration = _register(Histogram("stage_duration_seconds", "Wall time of each compute stage.", STAGE_BUCKETS))
+stage_last_duration = _register(Metric("stage_last_duration_seconds", "Wall time of the most recent run of each stage.", "gauge"))
+stage_peak_memory = _register(Metric("stage_peak_memory_bytes", "Peak traced memory above the stage's starting point (tracemalloc).", "gauge"))
+stage_output_size = _register(Metric("stage_output_size", "Number of items produced by the most recent run of each stage.", "gauge"))
+stage_errors = _register(Metric("stage_errors_total", "Number of stage runs that raised an exception.", "counter"))
+graph_nodes = _register(Metric("graph_nodes", "Number of nodes in each graph after the last rebuild.", "gauge"))
+graph_edges = _register(Metric("graph_edges", "Number of edges in each graph after the last rebuild.", "gauge"))
+pending_ratings = _register(Metric("pending_ratings", "Ratings accepted but not yet reflected in the published snapshot.", "gauge"))
+coalesced_requests = _register(Metric("coalesced_requests_total", "Requests answered by an identical request already in flight.", "counter"))
+response_cache_hits = _register(Metric("response_cache_hits_total", "Recommendation responses served from the response cache.", "counter"))
+response_cache_misses = _register(Metric("response_cache_misses_total", "Recommendation responses that had to be rendered.", "counter"))
+response_cache_evictions = _register(Metric("response_cache_evictions_total", "Entries removed from the response cache, by reason (lru, ttl, invalidated).", "counter"))
+response_cache_entries = _register(Metric("response_cache_entries", "Number of (user, algorithm) entries in the response cache.", "gauge"))
+snapshot_version = _register(Metric("snapshot_version", "Version of the currently published recommendation snapshot.", "gauge"))
+
+class StageResult:
+    """Cho phép code bên trong stage ghi lại kích thước đầu ra."""
+
+    def __init__(self):
+        self.output_size = None
+
+# Khi khác None, các phép đo stage được ghi thêm vào danh sách này để gửi từ tiến trình con về tiến trình cha
+_recording = None
+
+# Trạng thái theo luồng: ngăn xếp các stage đang đo bộ nhớ [điểm xuất phát, đỉnh lớn nhất đã thấy]
+# và cờ cho biết đang có stage được profile
+_memory_stack = threading.local()
+
+def _enter_memory():
+    stack = getattr(_memory_stack, "stack", None)
+    if stack is None:
+        stack = _memory_stack.stack = []
+    if not stack and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        # Giữ lại đỉnh của stage cha trước khi reset cho stage con
+        stack[-1][1] = max(stack[-1][1], peak)
+    tracemalloc.reset_peak()
+    stack.append([current, current])
+
+def _exit_memory():
+    stack = _memory_stack.stack
+    start, seen = stack.pop()
+    peak = max(seen, tracemalloc.get_traced_memory()[1])
+    if stack:
+        stack[-1][1] = max(stack[-1][1], peak)
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.stop()
+    return peak - start
+
+@contextmanager
+def stage(name, trace_memory=None):
+    """Đo thời gian, bộ nhớ đỉnh và (tuỳ chọn) cProfile cho một stage tính toán."""
+    trace_memory = TRACE_MEMORY if trace_memory is None else trace_memory
+    result = StageResult()
+    # Chỉ stage ngoài cùng được profile vì cProfile không hỗ trợ lồng nhau
+    profiler = cProfile.Profile() if PROFILE_DIR and not getattr(_memory_stack, "profiling", False) else None
+    if trace_memory:
+        _enter_memory()
+    if profiler:
+        _memory_stack.profiling = True
+        profiler.enable()
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield result
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiler:
+            profiler.disable()
+            _memory_stack.profiling = False
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name.replace(':', '_')}-{int(time.time())}.prof"))
+        peak_memory = _exit_memory() if trace_memory else None
+        record_stage(name, elapsed, peak_memory, result.output_size, failed)
+
+def record_stage(name, elapsed, peak_memory=None, output_size=None, failed=False):
+    """Cập nhật các metric của một lần chạy stage."""
+    if _recording is not None:
+        _recording.append((name, elapsed, peak_memory, output_size, failed))
+    if failed:
+        stage_errors.inc(stage=name)
+    if peak_memory is not None:
+        stage_peak_memory.set(peak_memory, stage=name)
+    stage_duration.observe(elapsed, stage=name)
+    stage_last_duration.set(elapsed, stage=name)
+    if output_size is not None:
+        stage_output_size.set(output_size, stage=name)
+
+@contextmanager
+def recording():
+    """Thu các phép đo stage trong khối lệnh (ở tiến trình con) để tiến trình cha gộp lại bằng `replay`."""
+    global _recording
+    previous, _recording = _recording, []
+    try:
+        yield _recording
+    finally:
+        _recording = previous
+
+def replay(measurements):
+    for measurement in measurements:
+        record_stage(*measurement)
+
+def record_graph(name, nodes, edges):
+    graph_nodes.set(nodes, graph=name)
+    graph_edges.set(edges, graph=name)
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
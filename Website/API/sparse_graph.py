@@ -0,0 +1,883 @@
+# sparse_graph.py
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import hashlib
+import heapq
+import multiprocessing
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+import networkx as nx
+import scipy.sparse as sp
+
+PROJECTION_MODES = ("count", "cosine", "jaccard", "time_decay")
+
+class ProjectionOptions(NamedTuple):
+    """Cách tính trọng số của đồ thị chiếu user-user và cách tỉa các cạnh yếu."""
+    mode: str = "count"            # một trong PROJECTION_MODES
+    threshold: float = 0.0         # bỏ các cạnh có trọng số nhỏ hơn ngưỡng (0 = giữ tất cả)
+    top_k: int = 0                 # chỉ giữ k hàng xóm mạnh nhất của mỗi user (0 = giữ tất cả)
+    half_life_days: float = 30.0   # chu kỳ bán rã của trọng số rating cho time_decay
+
+def build_incidence(ratings, values=None, dtype=np.float32):
+    """Xây dựng ma trận liên thuộc user×movie (CSR) trực tiếp từ DataFrame ratings.
+
+    Trả về (incidence, user_ids, movie_ids), trong đó hàng i ứng với user_ids[i]
+    và cột j ứng với movie_ids[j]. Nếu có `values`, ô (i, j) chứa giá trị cột đó
+    (ví dụ 'rating') thay vì 1.
+    """
+    user_codes, user_ids = pd.factorize(ratings['userId'])
+    movie_codes, movie_ids = pd.factorize(ratings['tmdbId'])
+
+    if values is None:
+        data = np.ones(len(user_codes), dtype=np.int32)
+    else:
+        data = ratings[values].to_numpy(dtype=dtype)
+    incidence = sp.csr_matrix(
+        (data, (user_codes, movie_codes)),
+        shape=(len(user_ids), len(movie_ids)),
+    )
+    if values is None:
+        # Một user đánh giá cùng một phim nhiều lần chỉ tính là một cạnh
+        incidence.data[:] = 1
+    return incidence, np.asarray(user_ids, dtype=object), np.asarray(movie_ids)
+
+def project_users(incidence, rating_matrix=None, timestamp_matrix=None, options=None):
+    """Đồ thị chiếu user-user có trọng số, tính bằng tích ma trận thưa theo `options.mode`:
+
+    - count: số phim cả i và j đều đã xem (B @ B.T)
+    - cosine: cosine giữa các vector rating đã trừ rating trung bình của từng user
+    - jaccard: |phim chung| / |phim của i hoặc j|
+    - time_decay: như count nhưng mỗi rating có trọng số 2^(-tuổi / half_life) so với rating mới nhất
+
+    Chỉ giữ các cạnh có trọng số dương, sau đó tỉa theo `options.threshold` và `options.top_k`.
+    """
+    options = options or ProjectionOptions()
+    if options.mode == "count":
+        weights = incidence @ incidence.T
+    elif options.mode == "jaccard":
+        counts = (incidence @ incidence.T).tocoo()
+        sizes = np.diff(sp.csr_matrix(incidence).indptr)
+        union = sizes[counts.row] + sizes[counts.col] - counts.data
+        weights = sp.csr_matrix(((counts.data / union).astype(np.float32), (counts.row, counts.col)), shape=counts.shape)
+    elif options.mode == "cosine":
+        matrix = sp.csr_matrix(incidence if rating_matrix is None else rating_matrix, dtype=np.float64)
+        counts = np.diff(matrix.indptr)
+        means = np.divide(np.asarray(matrix.sum(axis=1)).ravel(), counts, out=np.zeros(len(counts)), where=counts > 0)
+        matrix.data -= np.repeat(means, counts)
+        matrix.eliminate_zeros()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        matrix = sp.diags(np.divide(1.0, norms, out=np.zeros(len(norms)), where=norms > 0)) @ matrix
+        weights = (matrix @ matrix.T).astype(np.float32)
+    elif options.mode == "time_decay":
+        if timestamp_matrix is None:
+            raise ValueError("time_decay projection requires rating timestamps")
+        matrix = sp.csr_matrix(timestamp_matrix, dtype=np.float64)
+        age_days = (matrix.data.max(initial=0) - matrix.data) / 86400
+        decayed = sp.csr_matrix((np.exp2(-age_days / options.half_life_days), matrix.indices, matrix.indptr), shape=matrix.shape)
+        weights = (decayed @ decayed.T).astype(np.float32)
+    else:
+        raise ValueError(f"unknown projection mode {options.mode!r}, expected one of {PROJECTION_MODES}")
+
+    weights = sp.csr_matrix(weights)
+    weights.setdiag(0)
+    # Độ tương đồng âm hoặc chỉ là sai số làm tròn (cosine sau khi trừ trung bình) không thành cạnh
+    floor = 0 if np.issubdtype(weights.dtype, np.integer) else np.finfo(np.float32).eps
+    weights.data[weights.data <= floor] = 0
+    weights.eliminate_zeros()
+    return prune_projection(weights, options.threshold, options.top_k)
+
+def prune_projection(weights, threshold=0.0, top_k=0):
+    """Tỉa đồ thị chiếu: bỏ cạnh có trọng số < threshold, rồi chỉ giữ cạnh nằm trong top-k hàng xóm
+    của ít nhất một trong hai đầu mút (ma trận kết quả vẫn đối xứng)."""
+    if not threshold and not top_k:
+        return weights
+    weights = sp.csr_matrix(weights, copy=True)
+    if threshold:
+        weights.data[weights.data < threshold] = 0
+        weights.eliminate_zeros()
+    if top_k:
+        # Xếp hạng trong từng hàng theo trọng số giảm dần (bằng nhau thì theo chỉ số cột)
+        rows = np.repeat(np.arange(weights.shape[0]), np.diff(weights.indptr))
+        order = np.lexsort((weights.indices, -weights.data, rows))
+        rank = np.empty(weights.nnz, dtype=np.int64)
+        rank[order] = np.arange(weights.nnz) - weights.indptr[rows[order]]
+        kept = weights.copy()
+        kept.data[rank >= top_k] = 0
+        kept.eliminate_zeros()
+        weights = kept.maximum(kept.T).tocsr()
+    return weights
+
+def to_networkx(weights, user_ids=None):
+    """Dựng nx.Graph có thuộc tính 'weight' từ ma trận kề, tương đương weighted_projected_graph.
+
+    Không truyền `user_ids` thì node là chỉ số hàng 0..n-1 (băm số nguyên nhanh hơn chuỗi).
+    """
+    graph = nx.Graph()
+    upper = sp.triu(weights, k=1).tocoo()
+    if user_ids is None:
+        # Mảng object để các cạnh dùng chung một đối tượng int cho mỗi node
+        user_ids = np.array(range(weights.shape[0]), dtype=object)
+    graph.add_nodes_from(user_ids.tolist())
+    graph.add_weighted_edges_from(
+        zip(user_ids[upper.row].tolist(), user_ids[upper.col].tolist(), upper.data.tolist())
+    )
+    return graph
+
+class UserProjection:
+    """Đồ thị chiếu user-user lưu dưới dạng ma trận thưa.
+
+    Các thuật toán có thể dùng trực tiếp `weights`/`incidence`; bản NetworkX chỉ
+    được dựng (một lần) khi thuật toán thật sự cần đến.
+    """
+
+    def __init__(self, ratings, options=None):
+        # Chỉ giữ rating mới nhất nếu một user đánh giá lại cùng một phim
+        ratings = ratings.drop_duplicates(['userId', 'tmdbId'], keep='last')
+        self.incidence, self.user_ids, self.movie_ids = build_incidence(ratings)
+        self.rating_matrix = build_incidence(ratings, 'rating')[0] if 'rating' in ratings else None
+        timestamps = None
+        if options is not None and options.mode == "time_decay" and 'timestamp' in ratings:
+            timestamps = build_incidence(ratings, 'timestamp', np.float64)[0]
+        self.weights = project_users(self.incidence, self.rating_matrix, timestamps, options)
+        self.user_index = {user: i for i, user in enumerate(self.user_ids.tolist())}
+        self._graph = None
+
+    @classmethod
+    def from_matrices(cls, incidence, rating_matrix, user_ids, movie_ids, weights=None,
+                      timestamp_matrix=None, options=None):
+        """Dựng UserProjection từ ma trận liên thuộc đã có sẵn (ví dụ từ bộ nạp theo chunk)."""
+        projection = cls.__new__(cls)
+        projection.incidence = incidence
+        projection.rating_matrix = rating_matrix
+        projection.user_ids = np.asarray(user_ids, dtype=object)
+        projection.movie_ids = np.asarray(movie_ids)
+        if weights is None:
+            weights = project_users(incidence, rating_matrix, timestamp_matrix, options)
+        projection.weights = weights
+        projection.user_index = {user: i for i, user in enumerate(projection.user_ids.tolist())}
+        projection._graph = None
+        return projection
+
+    def number_of_nodes(self):
+        return self.weights.shape[0]
+
+    def number_of_edges(self):
+        return self.weights.nnz // 2
+
+    def movie_index(self):
+        """Chỉ mục {user: {tmdbId: rating}} dựng từ ma trận rating (rating = 1 nếu không có)."""
+        matrix = self.incidence if self.rating_matrix is None else self.rating_matrix
+        movie_ids = self.movie_ids.tolist()
+        index = {}
+        for i, user in enumerate(self.user_ids.tolist()):
+            start, end = matrix.indptr[i], matrix.indptr[i + 1]
+            index[user] = dict(zip(
+                [movie_ids[j] for j in matrix.indices[start:end]],
+                matrix.data[start:end].tolist(),
+            ))
+        return index
+
+    def to_networkx(self):
+        # Node là chỉ số hàng; dịch sang userId bằng self.user_ids
+        if self._graph is None:
+            self._graph = to_networkx(self.weights)
+        return self._graph
+
+    def edges(self):
+        """Danh sách cạnh (userId, tmdbId) của đồ thị bipartite, đọc từ ma trận liên thuộc."""
+        coo = self.incidence.tocoo()
+        return list(zip(self.user_ids[coo.row].tolist(), self.movie_ids[coo.col].tolist()))
+
+    def to_shared(self):
+        """Chép các mảng CSR vào shared memory để tiến trình con đọc mà không cần pickle đồ thị.
+
+        Trả về (mô tả, các khối shared memory); bên gọi giữ các khối và unlink sau khi dùng xong.
+        """
+        matrices = {"incidence": self.incidence, "weights": self.weights}
+        if self.rating_matrix is not None:
+            matrices["rating_matrix"] = self.rating_matrix
+        arrays = {
+            f"{name}.{part}": getattr(matrix, part)
+            for name, matrix in matrices.items()
+            for part in ("indptr", "indices", "data")
+        }
+        descriptor, blocks = share_arrays(arrays)
+        return {
+            "arrays": descriptor,
+            "shapes": {name: matrix.shape for name, matrix in matrices.items()},
+            "user_ids": self.user_ids.tolist(),
+            "movie_ids": self.movie_ids.tolist(),
+        }, blocks
+
+    @classmethod
+    def from_shared(cls, shared):
+        """Dựng lại UserProjection từ mô tả của to_shared() (gọi trong tiến trình con)."""
+        arrays = attach_arrays(shared["arrays"])
+        matrices = {
+            name: sp.csr_matrix(
+                tuple(arrays[f"{name}.{part}"] for part in ("data", "indices", "indptr")), shape=shape
+            )
+            for name, shape in shared["shapes"].items()
+        }
+        return cls.from_matrices(
+            matrices["incidence"], matrices.get("rating_matrix"),
+            shared["user_ids"], shared["movie_ids"], matrices["weights"],
+        )
+
+def share_arrays(arrays):
+    """Chép các mảng NumPy vào các khối shared memory; trả về (mô tả, các khối)."""
+    descriptor, blocks = {}, []
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        descriptor[name] = (block.name, array.shape, array.dtype.str)
+        blocks.append(block)
+    return descriptor, blocks
+
+def attach_arrays(descriptor):
+    """Đọc các mảng đã chia sẻ bởi share_arrays; mỗi mảng được chép ra để có thể đóng khối ngay."""
+    arrays = {}
+    for name, (block_name, shape, dtype) in descriptor.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        arrays[name] = np.ndarray(shape, dtype, buffer=block.buf).copy()
+        block.close()
+    return arrays
+
+def as_networkx(graph):
+    """Trả về (nx.Graph với node là chỉ số 0..n-1, danh sách id node) cho cả UserProjection lẫn nx.Graph."""
+    if isinstance(graph, UserProjection):
+        return graph.to_networkx(), graph.user_ids.tolist()
+    nodes = list(graph.nodes())
+    return nx.convert_node_labels_to_integers(graph), nodes
+
+class IdIndex:
+    """Ánh xạ hai chiều id ngoài <-> chỉ số nguyên liên tục; chỉ thêm, không xoá nên chỉ số ổn định."""
+
+    def __init__(self, ids=()):
+        self.ids = list(ids)
+        self.index = {x: i for i, x in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, x):
+        return x in self.index
+
+    def add(self, x):
+        code = self.index.get(x)
+        if code is None:
+            code = self.index[x] = len(self.ids)
+            self.ids.append(x)
+        return code
+
+def _row(matrix, i):
+    # (chỉ số cột, giá trị) của hàng i trong CSR; hàng ngoài phạm vi (node thêm sau) là rỗng
+    if i >= matrix.shape[0]:
+        return (), ()
+    start, end = matrix.indptr[i], matrix.indptr[i + 1]
+    return matrix.indices[start:end], matrix.data[start:end]
+
+def _has_entry(matrix, i, j):
+    if i >= matrix.shape[0]:
+        return False
+    start, end = matrix.indptr[i], matrix.indptr[i + 1]
+    position = start + np.searchsorted(matrix.indices[start:end], j)
+    return position < end and matrix.indices[position] == j
+
+class GraphCore:
+    """Đồ thị bipartite user-movie và đồ thị chiếu user-user trên chỉ số int32.
+
+    Phần gốc là các mảng CSR lấy từ UserProjection (user -> (phim, rating), phim -> user,
+    user -> (user, trọng số)). Cạnh thêm sau đó được ghi vào các dict delta theo chỉ số
+    cho tới lần dựng lại toàn bộ tiếp theo. Id ngoài (userId, tmdbId) chỉ được dùng ở
+    biên qua `users`/`movies`.
+    """
+
+    def __init__(self, projection, patch_projection=True):
+        self.users = IdIndex(projection.user_ids.tolist())
+        self.movies = IdIndex(projection.movie_ids.tolist())
+        ratings = projection.rating_matrix
+        if ratings is None:
+            ratings = projection.incidence.astype(np.float32)
+        self.ratings = self._compact(ratings, np.float32)
+        self.audience_matrix = self._compact(projection.incidence.T, np.int32)
+        # Trọng số là số phim chung (int32) hoặc độ tương đồng (float32) tuỳ chế độ chiếu. Chỉ đồ thị
+        # đếm phim chung chưa tỉa mới vá tăng dần được (mỗi rating cộng 1 phim chung); với độ tương đồng
+        # hoặc đồ thị đã tỉa (`patch_projection=False`) rating mới chỉ được ghi vào đồ thị bipartite,
+        # cạnh chiếu của nó có từ lần dựng lại toàn bộ tiếp theo
+        self.patch_projection = patch_projection
+        integer = np.issubdtype(projection.weights.dtype, np.integer)
+        self.weights = self._compact(projection.weights, np.int32 if integer else np.float32)
+        self.degrees = np.diff(self.weights.indptr).astype(np.int32)
+        self.rating_delta = {}      # {user: {movie: rating}}
+        self.audience_delta = {}    # {movie: [user]}
+        self.weight_delta = {}      # {user: {user: trọng số cộng thêm}}
+        self._adjacency = None      # weights + weight_delta dạng CSR, dựng ở lần đầu cần đến rồi vá theo từng rating
+        self.number_of_ratings = self.ratings.nnz
+        self.number_of_edges = self.weights.nnz // 2
+
+    @staticmethod
+    def _compact(matrix, dtype):
+        matrix = sp.csr_matrix(matrix, dtype=dtype)
+        if not matrix.has_sorted_indices:
+            # Ma trận từ checkpoint có thể là memory-map chỉ đọc: sắp xếp trên bản sao
+            matrix = matrix.copy()
+            matrix.sort_indices()
+        matrix.indices = matrix.indices.astype(np.int32, copy=False)
+        return matrix
+
+    def movies_of(self, u):
+        """{movie: rating} của user u (theo chỉ số)."""
+        indices, data = _row(self.ratings, u)
+        row = dict(zip(np.asarray(indices).tolist(), np.asarray(data).tolist()))
+        row.update(self.rating_delta.get(u, ()))
+        return row
+
+    def audience(self, m):
+        """Danh sách user (chỉ số) đã đánh giá phim m."""
+        indices, _ = _row(self.audience_matrix, m)
+        return np.asarray(indices).tolist() + self.audience_delta.get(m, [])
+
+    def co_raters(self, u):
+        """{user: số phim chung} với user u, đếm trực tiếp trên đồ thị bipartite."""
+        counts = {}
+        for m in self.movies_of(u):
+            for v in self.audience(m):
+                if v != u:
+                    counts[v] = counts.get(v, 0) + 1
+        return counts
+
+    def neighbors(self, u):
+        """{user: trọng số} của user u trên đồ thị chiếu."""
+        indices, data = _row(self.weights, u)
+        row = dict(zip(np.asarray(indices).tolist(), np.asarray(data).tolist()))
+        for v, weight in self.weight_delta.get(u, {}).items():
+            row[v] = row.get(v, 0) + weight
+        return row
+
+    def add_rating(self, user, movie, rating=1.0):
+        """Thêm cạnh (user, movie) và vá đồ thị chiếu; trả về tập chỉ số user bị ảnh hưởng.
+
+        Nếu rating đã tồn tại thì chỉ cập nhật giá trị và trả về tập rỗng.
+        """
+        u, m = self.users.add(user), self.movies.add(movie)
+        if len(self.degrees) < len(self.users):
+            self.degrees = np.concatenate([self.degrees, np.zeros(len(self.users) - len(self.degrees), np.int32)])
+
+        ratings_of_u = self.rating_delta.setdefault(u, {})
+        if m in ratings_of_u or _has_entry(self.ratings, u, m):
+            ratings_of_u[m] = rating
+            return set()
+
+        audience = self.audience(m)
+        ratings_of_u[m] = rating
+        self.audience_delta.setdefault(m, []).append(u)
+        self.number_of_ratings += 1
+        if not self.patch_projection:
+            return {u}
+
+        added = self.weight_delta.setdefault(u, {})
+        for v in audience:
+            if v not in added and not _has_entry(self.weights, u, v):
+                self.degrees[u] += 1
+                self.degrees[v] += 1
+                self.number_of_edges += 1
+            added[v] = added.get(v, 0) + 1
+            reverse = self.weight_delta.setdefault(v, {})
+            reverse[u] = reverse.get(u, 0) + 1
+        if self._adjacency is not None and audience:
+            # Mỗi khán giả cũ của phim có thêm một phim chung với u (cả hai chiều)
+            n = len(self.users)
+            self._adjacency.resize((n, n))
+            self._adjacency = self._adjacency + sp.csr_matrix(
+                (np.ones(2 * len(audience), dtype=self._adjacency.dtype),
+                 ([u] * len(audience) + audience, audience + [u] * len(audience))),
+                shape=(n, n),
+            )
+        return {u, *audience}
+
+    def adjacency(self):
+        """Ma trận kề CSR n×n của đồ thị chiếu hiện tại (gồm cả các cạnh vá sau lần dựng lại)."""
+        n = len(self.users)
+        if self._adjacency is None:
+            rows, cols, data = [], [], []
+            for u, added in self.weight_delta.items():
+                rows.extend([u] * len(added))
+                cols.extend(added)
+                data.extend(added.values())
+            base = self.weights.copy()
+            base.resize((n, n))
+            delta = sp.csr_matrix(
+                (np.asarray(data, dtype=base.dtype), (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))),
+                shape=(n, n),
+            )
+            self._adjacency = (base + delta).tocsr()
+        elif self._adjacency.shape[0] < n:
+            self._adjacency.resize((n, n))
+        return self._adjacency
+
+    def movie_ratings(self, user):
+        """{tmdbId: rating} của một userId (dịch chỉ số sang id ngoài)."""
+        u = self.users.index.get(user)
+        if u is None:
+            return {}
+        movie_ids = self.movies.ids
+        return {movie_ids[m]: rating for m, rating in self.movies_of(u).items()}
+
+def adjacency(graph, weight=None):
+    """Trả về (ma trận kề CSR, mảng id node) cho cả UserProjection lẫn nx.Graph.
+
+    Với nx.Graph, `weight` là tên thuộc tính trọng số cạnh (None = ma trận nhị phân).
+    """
+    if isinstance(graph, UserProjection):
+        return graph.weights, graph.user_ids
+    nodes = list(graph.nodes())
+    matrix = nx.to_scipy_sparse_array(graph, nodelist=nodes, weight=weight, format='csr')
+    return sp.csr_matrix(matrix), np.asarray(nodes, dtype=object)
+
+def score_links(adjacency, thresholds, k=10, rows=None, block_elements=4_000_000):
+    """Chấm điểm dự đoán liên kết CN, Jaccard, Adamic-Adar và PA cho các cặp chưa liên kết.
+
+    Các điểm được tính theo khối hàng từ tích ma trận thưa (A², A·D·A với
+    D = diag(1/log(deg)), vector bậc) nên bộ nhớ chỉ tỉ lệ với block × n.
+    Mỗi phương pháp trong `thresholds` chỉ giữ lại top-k ứng viên vượt ngưỡng
+    của từng user. Sinh ra các bộ (i, j, method, score) theo chỉ số hàng.
+    """
+    A = sp.csr_matrix(adjacency).astype(np.float64)
+    A.data[:] = 1.0
+    n = A.shape[0]
+    if n < 2:
+        return
+
+    degree = np.asarray(A.sum(axis=1)).ravel()
+    inv_log = np.zeros(n)
+    inv_log[degree > 1] = 1.0 / np.log(degree[degree > 1])
+    A_aa = (A @ sp.diags(inv_log)).tocsr()
+
+    rows = np.arange(n) if rows is None else np.asarray(rows, dtype=np.int64)
+    block = max(1, block_elements // n)
+    k = min(k, n - 1)
+
+    for start in range(0, len(rows), block):
+        idx = rows[start:start + block]
+        cn = (A[idx] @ A).toarray()
+        scores = {
+            "Common Neighbors": cn,
+            "Jaccard Coefficient": None,
+            "Adamic-Adar Index": None,
+            "Preferential Attachment": None,
+        }
+        if "Jaccard Coefficient" in thresholds:
+            union = degree[idx, None] + degree[None, :] - cn
+            scores["Jaccard Coefficient"] = np.divide(cn, union, out=np.zeros_like(cn), where=union > 0)
+        if "Adamic-Adar Index" in thresholds:
+            scores["Adamic-Adar Index"] = (A_aa[idx] @ A).toarray()
+        if "Preferential Attachment" in thresholds:
+            scores["Preferential Attachment"] = degree[idx, None] * degree[None, :]
+
+        # Chỉ xét cặp khác nhau và chưa có cạnh
+        excluded = A[idx].toarray() > 0
+        excluded[np.arange(len(idx)), idx] = True
+
+        for method, threshold in thresholds.items():
+            masked = np.where(~excluded & (scores[method] >= threshold), scores[method], -np.inf)
+            top = np.argpartition(-masked, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(masked, top, axis=1)
+            for r, c in zip(*np.nonzero(np.isfinite(top_scores))):
+                yield int(idx[r]), int(top[r, c]), method, float(top_scores[r, c])
+
+def score_candidate_links(adjacency, rows, cols, thresholds, k=10, block_elements=4_000_000):
+    """Như score_links nhưng chỉ chấm các cặp ứng viên (rows[t], cols[t]), ví dụ từ MinHashIndex.
+
+    Mỗi cặp chỉ tốn O(bậc) nên tổng chi phí tỉ lệ với số ứng viên thay vì n². Cặp trùng,
+    cặp một node với chính nó và cặp đã có cạnh bị bỏ qua.
+    """
+    A = sp.csr_matrix(adjacency).astype(np.float64)
+    A.data[:] = 1.0
+    rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+    if not len(rows):
+        return
+    pairs = np.unique(np.stack([rows, cols], axis=1), axis=0)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    pairs = pairs[np.asarray(A[pairs[:, 0], pairs[:, 1]]).ravel() == 0]
+    rows, cols = pairs[:, 0], pairs[:, 1]
+
+    degree = np.asarray(A.sum(axis=1)).ravel()
+    inv_log = np.zeros(len(degree))
+    inv_log[degree > 1] = 1.0 / np.log(degree[degree > 1])
+    A_aa = (A @ sp.diags(inv_log)).tocsr()
+
+    # Số phần tử khác 0 trung bình của một hàng quyết định kích thước khối cặp
+    block = max(1, int(block_elements // max(1.0, A.nnz / max(1, A.shape[0]))))
+    cn, aa = np.empty(len(rows)), np.empty(len(rows))
+    for start in range(0, len(rows), block):
+        i, j = rows[start:start + block], cols[start:start + block]
+        cn[start:start + block] = np.asarray(A[i].multiply(A[j]).sum(axis=1)).ravel()
+        aa[start:start + block] = np.asarray(A[i].multiply(A_aa[j]).sum(axis=1)).ravel()
+    union = degree[rows] + degree[cols] - cn
+    scores = {
+        "Common Neighbors": cn,
+        "Jaccard Coefficient": np.divide(cn, union, out=np.zeros_like(cn), where=union > 0),
+        "Adamic-Adar Index": aa,
+        "Preferential Attachment": degree[rows] * degree[cols],
+    }
+
+    for method, threshold in thresholds.items():
+        passed = np.flatnonzero(scores[method] >= threshold)
+        # Top-k theo từng hàng: sắp theo (hàng, điểm giảm dần) rồi lấy k phần tử đầu mỗi nhóm
+        order = passed[np.lexsort((-scores[method][passed], rows[passed]))]
+        starts = np.searchsorted(rows[order], rows[order], side="left")
+        for t in order[np.arange(len(order)) - starts < k].tolist():
+            yield int(rows[t]), int(cols[t]), method, float(scores[method][t])
+
+class MinHashIndex:
+    """Chỉ mục MinHash-LSH trên tập hàng xóm (đóng) của mỗi user trong đồ thị user-user.
+
+    Độ trùng khớp chữ ký MinHash ước lượng hệ số Jaccard giữa hai tập hàng xóm, nên các user
+    rơi vào cùng bucket ở ít nhất một band là ứng viên liên kết (thường cách nhau 2 bước).
+    Truy vấn chỉ duyệt các bucket của user (bỏ qua bucket lớn hơn max_bucket, thường do một
+    user trung tâm có giá trị băm nhỏ) thay vì mọi cặp. Chữ ký chỉ giảm khi tập lớn lên nên
+    thêm hàng xóm mới là cập nhật tại chỗ O(num_perm). User được khoá theo id ngoài.
+    """
+
+    PRIME = (1 << 31) - 1
+
+    def __init__(self, num_perm=128, bands=64, max_bucket=1000, seed=42):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        rng = np.random.default_rng(seed)
+        self.num_perm, self.bands, self.max_bucket = num_perm, bands, max_bucket
+        self.a = rng.integers(1, self.PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, self.PRIME, size=num_perm, dtype=np.uint64)
+        self.band_multipliers = rng.integers(1, 1 << 63, size=num_perm // bands, dtype=np.uint64) | np.uint64(1)
+        self.clear()
+
+    def clear(self):
+        self.users = IdIndex()
+        self.signatures = np.empty((0, self.num_perm), dtype=np.uint32)
+        self.keys = np.empty((0, self.bands), dtype=np.uint64)
+        self.buckets = [{} for _ in range(self.bands)]   # band -> {khoá: set(chỉ số user)}
+
+    def update(self, other):
+        """Chép trạng thái của một chỉ mục khác (ví dụ chỉ mục dựng trong tiến trình con)."""
+        self.__dict__.update(other.__dict__)
+
+    def __len__(self):
+        return len(self.users)
+
+    def __contains__(self, user):
+        return user in self.users
+
+    def _hash_items(self, item_ids):
+        # Băm id ngoài ổn định giữa các tiến trình rồi áp num_perm hoán vị (a·x + b) mod p
+        x = pd.util.hash_array(np.asarray(item_ids, dtype=object)) % np.uint64(self.PRIME)
+        return ((self.a[:, None] * x[None, :] + self.b[:, None]) % np.uint64(self.PRIME)).astype(np.uint32)
+
+    def _band_keys(self, signatures):
+        rows = signatures.reshape(len(signatures), self.bands, self.num_perm // self.bands).astype(np.uint64)
+        return (rows * self.band_multipliers).sum(axis=2)
+
+    def _grow(self, n):
+        if n > len(self.signatures):
+            extra = n - len(self.signatures)
+            self.signatures = np.vstack([self.signatures, np.full((extra, self.num_perm), self.PRIME, dtype=np.uint32)])
+            self.keys = np.vstack([self.keys, np.zeros((extra, self.bands), dtype=np.uint64)])
+
+    def _rebucket(self, codes, signatures):
+        # User chưa có hàng xóm (chữ ký toàn PRIME) không được đưa vào bucket
+        keys = self._band_keys(signatures)
+        for code, old, new, signature in zip(codes.tolist(), self.keys[codes], keys, signatures):
+            empty = signature[0] == self.PRIME
+            for band, buckets in enumerate(self.buckets):
+                members = buckets.get(int(old[band]))
+                if members is not None:
+                    members.discard(code)
+                    if not members:
+                        del buckets[int(old[band])]
+                if not empty:
+                    buckets.setdefault(int(new[band]), set()).add(code)
+        self.keys[codes] = keys
+        self.signatures[codes] = signatures
+
+    def _segment_min(self, matrix, values, block_elements):
+        # min của values[cột] trên từng hàng CSR (hàng rỗng giữ PRIME), chia khối để giới hạn bộ nhớ
+        result = np.full((matrix.shape[0], self.num_perm), self.PRIME, dtype=np.uint32)
+        block = max(1, block_elements // self.num_perm)
+        start = 0
+        while start < matrix.shape[0]:
+            end = int(np.searchsorted(matrix.indptr, matrix.indptr[start] + block, side="right")) - 1
+            end = min(matrix.shape[0], max(end, start + 1))
+            nonempty = np.flatnonzero(np.diff(matrix.indptr[start:end + 1]))
+            if len(nonempty):
+                segment = values[matrix.indices[matrix.indptr[start]:matrix.indptr[end]]]
+                offsets = (matrix.indptr[start:end] - matrix.indptr[start])[nonempty]
+                result[start + nonempty] = np.minimum.reduceat(segment, offsets, axis=0)
+            start = end
+        return result
+
+    def build(self, incidence, user_ids, block_elements=4_000_000):
+        """Dựng lại chỉ mục từ ma trận liên thuộc user×movie.
+
+        Tập của user u là các user đã xem chung ít nhất một phim với u (gồm cả u), tức hợp các
+        khán giả của từng phim u đã xem, nên chữ ký được tính qua min theo phim với chi phí
+        O(số rating × num_perm) thay vì O(số cạnh chiếu × num_perm).
+        """
+        B = sp.csr_matrix(incidence)
+        self.clear()
+        self.users = IdIndex(list(user_ids))
+        self._grow(len(self.users))
+        hashes = self._hash_items(user_ids).T                       # (user, num_perm)
+        movie_minimum = self._segment_min(B.T.tocsr(), hashes, block_elements)
+        signatures = self._segment_min(B, movie_minimum, block_elements)
+        self._rebucket(np.arange(B.shape[0]), signatures)
+
+    def add_edges(self, user, others):
+        """Thêm các cạnh user–other (ví dụ khi user đánh giá phim mà `others` đã xem)."""
+        others = [other for other in dict.fromkeys(others) if other != user]
+        if not others:
+            return
+        u = self.users.add(user)
+        codes = np.array([self.users.add(other) for other in others], dtype=np.int64)
+        self._grow(len(self.users))
+        # Tập của mỗi user luôn chứa chính user đó
+        signature = np.minimum(self.signatures[u], self._hash_items([user, *others]).min(axis=1))
+        reverse = np.minimum(self.signatures[codes], self._hash_items(others).T)
+        reverse = np.minimum(reverse, self._hash_items([user])[:, 0])
+        codes, signatures = np.append(codes, u), np.vstack([reverse, signature])
+        changed = np.any(signatures != self.signatures[codes], axis=1)
+        self._rebucket(codes[changed], signatures[changed])
+
+    def query(self, user, k=50, exclude=()):
+        """Tối đa k user có chữ ký giống `user` nhất, bỏ qua các user trong `exclude` (ví dụ hàng xóm
+        hiện có): danh sách (user, Jaccard ước lượng) giảm dần."""
+        u = self.users.index.get(user)
+        if u is None:
+            return []
+        candidates = set()
+        for band, buckets in enumerate(self.buckets):
+            members = buckets.get(int(self.keys[u, band]), ())
+            if len(members) <= self.max_bucket:
+                candidates.update(members)
+        candidates.discard(u)
+        if exclude:
+            index = self.users.index
+            candidates.difference_update(index[x] for x in exclude if x in index)
+        if not candidates:
+            return []
+        candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarity = (self.signatures[candidates] == self.signatures[u]).mean(axis=1)
+        order = np.lexsort((candidates, -similarity))[:k]
+        return [(self.users.ids[c], float(similarity[t])) for t, c in zip(order.tolist(), candidates[order].tolist())]
+
+def _cascade_chunk(task):
+    # Chạy `runs` mô phỏng IC, mỗi bước mở rộng toàn bộ frontier bằng một lần rút ngẫu nhiên cho mỗi cạnh
+    indptr, indices, probabilities, seeds, runs, seed_sequence = task
+    rng = np.random.default_rng(seed_sequence)
+    n = len(indptr) - 1
+    counts = np.zeros(n, dtype=np.int64)
+
+    for _ in range(runs):
+        active = np.zeros(n, dtype=bool)
+        active[seeds] = True
+        frontier = seeds
+        while frontier.size:
+            starts = indptr[frontier]
+            lengths = indptr[frontier + 1] - starts
+            total = lengths.sum()
+            if total == 0:
+                break
+            # Chỉ số (trong CSR) của các cạnh đi ra từ frontier tới node chưa kích hoạt
+            edge_index = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+            edge_index = edge_index[~active[indices[edge_index]]]
+            hit = rng.random(edge_index.size) < probabilities[edge_index]
+            frontier = np.unique(indices[edge_index[hit]])
+            active[frontier] = True
+        counts += active
+
+    return counts
+
+# Pool dùng lại giữa các lần mô phỏng: (số tiến trình, executor). Dùng forkserver để không fork tiến trình
+# API đa luồng (ví dụ khi thuật toán chạy ngay trong worker thread với ALGORITHM_WORKERS < 0)
+_cascade_pool = None
+
+def _cascade_executor(processes):
+    global _cascade_pool
+    if _cascade_pool is None or _cascade_pool[0] != processes:
+        if _cascade_pool is not None:
+            _cascade_pool[1].shutdown()
+        context = multiprocessing.get_context("forkserver")
+        _cascade_pool = (processes, ProcessPoolExecutor(max_workers=processes, mp_context=context))
+    return _cascade_pool[1]
+
+def simulate_cascades(adjacency, seeds, p=0.05, runs=1000, weighted=True, seed=None, processes=1, chunk_size=250):
+    """Mô phỏng Monte Carlo mô hình Independent Cascade trên ma trận kề CSR.
+
+    Nếu `weighted`, xác suất lây qua cạnh có trọng số w là 1 - (1 - p)^w (mỗi phim
+    chung là một cơ hội lây độc lập), ngược lại mọi cạnh dùng xác suất p. Các lượt
+    chạy được chia thành các khối `chunk_size` với seed con cố định, nên kết quả chỉ
+    phụ thuộc vào `seed` chứ không phụ thuộc số tiến trình. Trả về xác suất được
+    kích hoạt của từng node.
+    """
+    A = sp.csr_matrix(adjacency)
+    n = A.shape[0]
+    if n == 0 or runs <= 0:
+        return np.zeros(n)
+
+    if weighted:
+        probabilities = 1.0 - (1.0 - p) ** A.data.astype(np.float64)
+    else:
+        probabilities = np.full(A.nnz, p)
+    seeds = np.unique(np.asarray(seeds, dtype=np.int64))
+
+    chunks = [chunk_size] * (runs // chunk_size) + ([runs % chunk_size] if runs % chunk_size else [])
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [
+        (A.indptr, A.indices, probabilities, seeds, chunk_runs, seed_sequence)
+        for chunk_runs, seed_sequence in zip(chunks, seed_sequences)
+    ]
+
+    if processes == 1 or len(tasks) == 1:
+        counts = sum(map(_cascade_chunk, tasks))
+    else:
+        counts = sum(_cascade_executor(processes).map(_cascade_chunk, tasks))
+    return counts / runs
+
+def fingerprint(adjacency, node_ids):
+    """Dấu vân tay của đồ thị (cấu trúc, trọng số và thứ tự node), dùng làm phiên bản đồ thị."""
+    A = sp.csr_matrix(adjacency)
+    digest = hashlib.sha1(repr(list(node_ids)).encode())
+    for array in (A.indptr, A.indices, A.data):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+def move_nodes(adjacency, labels, frontier, resolution=1.0):
+    """Pha di chuyển node của Louvain chỉ bắt đầu từ các node trong `frontier`.
+
+    Mỗi node được chuyển sang cộng đồng lân cận có độ tăng modularity (có trọng số, độ phân giải
+    `resolution`) lớn nhất; khi node đổi cộng đồng, các hàng xóm ngoài cộng đồng mới được đưa vào
+    hàng đợi. Trả về mảng nhãn cộng đồng mới.
+    """
+    A = sp.csr_matrix(adjacency)
+    labels = np.array(labels, dtype=np.int64)
+    degrees = np.asarray(A.sum(axis=1), dtype=np.float64).ravel()
+    total = degrees.sum()
+    if not total:
+        return labels
+    totals = np.bincount(labels, weights=degrees)
+
+    queue = deque(sorted(frontier))
+    queued = np.zeros(A.shape[0], dtype=bool)
+    queued[list(queue)] = True
+    while queue:
+        i = queue.popleft()
+        queued[i] = False
+        neighbors = A.indices[A.indptr[i]:A.indptr[i + 1]]
+        weights = A.data[A.indptr[i]:A.indptr[i + 1]]
+        keep = neighbors != i
+        neighbors, weights = neighbors[keep], weights[keep]
+        if not len(neighbors):
+            continue
+
+        current = labels[i]
+        totals[current] -= degrees[i]
+        communities, inverse = np.unique(labels[neighbors], return_inverse=True)
+        gains = np.bincount(inverse, weights=weights) - resolution * totals[communities] * degrees[i] / total
+        position = np.searchsorted(communities, current)
+        if position < len(communities) and communities[position] == current:
+            current_gain = gains[position]
+        else:
+            current_gain = -resolution * totals[current] * degrees[i] / total
+        # argmax lấy cộng đồng có id nhỏ nhất khi bằng nhau nên kết quả tất định
+        best = int(np.argmax(gains))
+        target = communities[best] if gains[best] > current_gain else current
+        totals[target] += degrees[i]
+        if target != current:
+            labels[i] = target
+            moved = neighbors[(labels[neighbors] != target) & ~queued[neighbors]]
+            queue.extend(moved.tolist())
+            queued[moved] = True
+    return labels
+
+def degree_discount_seeds(adjacency, k, p=0.05):
+    """Chọn k node nguồn bằng heuristic DegreeDiscountIC (Chen et al., 2009)."""
+    A = sp.csr_matrix(adjacency)
+    n = A.shape[0]
+    degree = np.diff(A.indptr).astype(np.float64)
+    discounted = degree.copy()
+    selected_neighbors = np.zeros(n)
+    selected = np.zeros(n, dtype=bool)
+
+    seeds = []
+    for _ in range(min(k, n)):
+        v = int(np.argmax(np.where(selected, -np.inf, discounted)))
+        seeds.append(v)
+        selected[v] = True
+
+        neighbors = A.indices[A.indptr[v]:A.indptr[v + 1]]
+        neighbors = neighbors[~selected[neighbors]]
+        selected_neighbors[neighbors] += 1
+        t = selected_neighbors[neighbors]
+        discounted[neighbors] = degree[neighbors] - 2 * t - (degree[neighbors] - t) * t * p
+    return seeds
+
+def celf_seeds(adjacency, k, p=0.05, runs=200, weighted=True, seed=None, candidates=None, plus=True):
+    """Chọn k node nguồn bằng lazy-greedy CELF (hoặc CELF++ nếu `plus`).
+
+    Độ lan truyền được ước lượng bằng simulate_cascades với cùng một `seed` cho mọi
+    tập nguồn, và mọi ước lượng được lưu lại giữa các vòng lặp nên không tập nào bị
+    mô phỏng hai lần. `candidates` giới hạn tập ứng viên vào các node có bậc cao nhất.
+    """
+    A = sp.csr_matrix(adjacency)
+    n = A.shape[0]
+    degree = np.diff(A.indptr)
+    pool = np.argsort(-degree, kind='stable')[:candidates] if candidates else np.arange(n)
+
+    spread_cache = {}
+    def spread(nodes):
+        key = frozenset(nodes)
+        if key not in spread_cache:
+            spread_cache[key] = float(simulate_cascades(A, sorted(key), p, runs, weighted, seed).sum()) if key else 0.0
+        return spread_cache[key]
+
+    # state[v] = [mg1, prev_best, mg2, flag] theo ký hiệu của CELF++ (Goyal et al., 2011)
+    state = {}
+    heap = []
+    cur_best = None
+    for v in pool.tolist():
+        mg1 = spread([v])
+        mg2 = spread([v, cur_best]) - spread([cur_best]) if plus and cur_best is not None else None
+        state[v] = [mg1, cur_best, mg2, 0]
+        if cur_best is None or mg1 > state[cur_best][0]:
+            cur_best = v
+        heapq.heappush(heap, (-mg1, v))
+
+    selected = []
+    last_seed = None
+    cur_best = None
+    while heap and len(selected) < k:
+        _, v = heapq.heappop(heap)
+        mg1, prev_best, mg2, flag = state[v]
+        if flag == len(selected):
+            # Lợi ích biên đã được tính với tập nguồn hiện tại và vẫn lớn nhất
+            selected.append(v)
+            last_seed, cur_best = v, None
+            continue
+
+        if plus and mg2 is not None and prev_best == last_seed and flag == len(selected) - 1:
+            mg1 = mg2
+        else:
+            mg1 = spread(selected + [v]) - spread(selected)
+            prev_best = cur_best
+            if plus and cur_best is not None:
+                mg2 = spread(selected + [cur_best, v]) - spread(selected + [cur_best])
+            else:
+                mg2 = None
+        state[v] = [mg1, prev_best, mg2, len(selected)]
+        if cur_best is None or mg1 > state[cur_best][0]:
+            cur_best = v
+        heapq.heappush(heap, (-mg1, v))
+
+    return selected
@@ -0,0 +1,213 @@
+# storage.py
+import json
+import os
+import pickle
+import shutil
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+class WriteAheadLog:
+    """Nhật ký ghi trước dạng JSON lines, chỉ ghi nối tiếp.
+
+    Mỗi bản ghi được flush (và fsync nếu bật) trước khi request trả về, nên rating
+    và user đã được xác nhận không bị mất khi server khởi động lại.
+
+    `offset` là vị trí logic trong toàn bộ nhật ký: sau khi checkpoint đã chứa mọi bản ghi trước một
+    offset, `rotate` thay file bằng một đoạn mới chỉ gồm phần đuôi, mở đầu bằng dòng
+    {"type": "segment", "base": offset}, nên offset đã lưu trong checkpoint vẫn đúng.
+    """
+
+    def __init__(self, path, fsync=True):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.fsync = fsync
+        self._truncate_partial_line()
+        self.base, self.start = self._read_header()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def _read_header(self):
+        # (offset logic của bản ghi đầu tiên, vị trí byte của nó trong file); file chưa từng
+        # được xoay vòng không có dòng đầu đoạn
+        if not os.path.exists(self.path):
+            return 0, 0
+        with open(self.path, "rb") as f:
+            line = f.readline()
+        try:
+            header = json.loads(line)
+        except ValueError:
+            return 0, 0
+        if isinstance(header, dict) and header.get("type") == "segment":
+            return header["base"], len(line)
+        return 0, 0
+
+    def _truncate_partial_line(self):
+        # Cắt bỏ dòng cuối bị ghi dở (chưa có ký tự xuống dòng) khi server dừng giữa chừng,
+        # nếu không các bản ghi sau sẽ bị nối vào dòng hỏng và bị bỏ qua khi đọc lại
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            end = position = f.seek(0, os.SEEK_END)
+            while position > 0:
+                step = min(position, 1 << 16)
+                f.seek(position - step)
+                newline = f.read(step).rfind(b"\n")
+                if newline >= 0:
+                    position += newline + 1 - step
+                    break
+                position -= step
+            if position < end:
+                f.truncate(position)
+                f.flush()
+                os.fsync(f.fileno())
+
+    @property
+    def offset(self):
+        return self.base + self.file.tell() - self.start
+
+    def append(self, entry):
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def read_from(self, offset):
+        # Bỏ qua dòng cuối bị ghi dở nếu server dừng giữa chừng
+        if offset < self.base:
+            raise ValueError(f"log entries before offset {self.base} were removed by rotation, cannot read from {offset}")
+        entries = []
+        with open(self.path, encoding="utf-8") as f:
+            f.seek(self.start + offset - self.base)
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+        return entries
+
+    def rotate(self, offset):
+        """Bỏ các bản ghi trước `offset` (đã có trong checkpoint hiện tại) bằng cách chép phần đuôi
+        sang một đoạn mới rồi thay file một cách nguyên tử. Bên gọi phải chặn append trong lúc xoay vòng."""
+        if offset <= self.base:
+            return
+        self.file.flush()
+        header = (json.dumps({"type": "segment", "base": offset}) + "\n").encode()
+        segment = self.path + ".tmp"
+        with open(self.path, "rb") as source, open(segment, "wb") as target:
+            target.write(header)
+            source.seek(self.start + offset - self.base)
+            shutil.copyfileobj(source, target)
+            target.flush()
+            os.fsync(target.fileno())
+        self.file.close()
+        os.replace(segment, self.path)
+        if self.fsync:
+            _fsync_directory(os.path.dirname(self.path) or ".")
+        self.base, self.start = offset, len(header)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self.file.close()
+
+def _fsync_directory(path):
+    # Ghi bền thao tác đổi tên trong thư mục (không hỗ trợ trên Windows)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _write_json(path, value):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_checkpoint(data_dir, ratings, users, movies, projection, state, wal_offset):
+    """Ghi một checkpoint dạng cột: rating và ma trận chiếu dưới dạng mảng .npy,
+    user/movie dạng JSON, gợi ý và trạng thái thuật toán dạng pickle.
+
+    Checkpoint được ghi vào thư mục mới rồi mới trỏ CURRENT sang, nên một lần ghi
+    dở dang không làm hỏng checkpoint trước đó.
+    """
+    checkpoints = os.path.join(data_dir, "checkpoints")
+    os.makedirs(checkpoints, exist_ok=True)
+    previous = current_checkpoint(data_dir)
+    name = str(int(previous or 0) + 1)
+    path = os.path.join(checkpoints, name)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+    # userId được lưu dưới dạng mã số nguyên để có thể memory-map
+    user_codes, user_ids = pd.factorize(ratings["userId"])
+    np.save(os.path.join(path, "ratings_user.npy"), user_codes.astype(np.int32))
+    for column in ("tmdbId", "rating", "timestamp"):
+        np.save(os.path.join(path, f"ratings_{column}.npy"), ratings[column].to_numpy())
+    _write_json(os.path.join(path, "rating_users.json"), list(user_ids))
+
+    weights = sp.csr_matrix(projection.weights)
+    for array in ("indptr", "indices", "data"):
+        np.save(os.path.join(path, f"projection_{array}.npy"), getattr(weights, array))
+    _write_json(os.path.join(path, "projection_users.json"), projection.user_ids.tolist())
+
+    _write_json(os.path.join(path, "users.json"), list(users.values()))
+    _write_json(os.path.join(path, "movies.json"), list(movies.values()))
+    with open(os.path.join(path, "state.pkl"), "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    _write_json(os.path.join(path, "meta.json"), {"wal_offset": wal_offset, "rating_count": len(ratings)})
+
+    # Chuyển CURRENT sang checkpoint mới một cách nguyên tử rồi mới xoá checkpoint cũ
+    pointer = os.path.join(data_dir, "CURRENT")
+    with open(pointer + ".tmp", "w") as f:
+        f.write(name)
+    os.replace(pointer + ".tmp", pointer)
+    if previous is not None:
+        shutil.rmtree(os.path.join(checkpoints, previous), ignore_errors=True)
+    return name
+
+def current_checkpoint(data_dir):
+    pointer = os.path.join(data_dir, "CURRENT")
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer) as f:
+        return f.read().strip() or None
+
+def load_checkpoint(data_dir):
+    """Đọc checkpoint hiện tại; các mảng lớn được memory-map thay vì đọc vào RAM."""
+    name = current_checkpoint(data_dir)
+    if name is None:
+        return None
+    path = os.path.join(data_dir, "checkpoints", name)
+
+    load = lambda filename: np.load(os.path.join(path, filename), mmap_mode="r")
+    # Cột userId giữ nguyên mã int32 (memory-map), chỉ danh sách userId khác nhau được đọc vào RAM
+    ratings = {
+        "userId": load("ratings_user.npy"),
+        "tmdbId": load("ratings_tmdbId.npy"),
+        "rating": load("ratings_rating.npy"),
+        "timestamp": load("ratings_timestamp.npy"),
+    }
+    projection_users = np.asarray(_read_json(os.path.join(path, "projection_users.json")), dtype=object)
+    weights = sp.csr_matrix(
+        (load("projection_data.npy"), load("projection_indices.npy"), load("projection_indptr.npy")),
+        shape=(len(projection_users), len(projection_users)),
+    )
+    with open(os.path.join(path, "state.pkl"), "rb") as f:
+        state = pickle.load(f)
+
+    return {
+        "ratings": ratings,
+        "rating_users": _read_json(os.path.join(path, "rating_users.json")),
+        "users": _read_json(os.path.join(path, "users.json")),
+        "movies": _read_json(os.path.join(path, "movies.json")),
+        "projection": (weights, projection_users),
+        "state": state,
+        **_read_json(os.path.join(path, "meta.json")),
+    }
@@ -9,28 +9,50 @@ st.set_page_config(layout="wide",page_title="Movie Recommendation System", page_
 ########## Fetch data from API
 API_URL = "http://127.0.0.1:8000"
 
+# Phiên bản dữ liệu hiện tại của API, dùng làm khoá cho st.cache_data: mỗi lần rerun chỉ gọi một
+# endpoint nhỏ, danh sách user và gợi ý chỉ được tải lại khi dữ liệu phía API đã thay đổi
+def fetch_versions():
+    try:
+        response = requests.get(f"{API_URL}/recommendations/snapshot")
+        response.raise_for_status()
+        data = response.json()
+        return data["boot_id"], data["version"], data["data_versions"]
+    except requests.exceptions.RequestException:
+        return None, None, {}
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def get_json(endpoint, version):
+    response = requests.get(f"{API_URL}/{endpoint}")
+    response.raise_for_status()  # Lỗi không được cache, lần sau sẽ gọi lại
+    return response.json()
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def post_json(endpoint, payload, version):
+    response = requests.post(f"{API_URL}/{endpoint}", json=payload)
+    response.raise_for_status()
+    return response.json()
+
 def fetch_data(endpoint):
+    boot_id, _, data_versions = fetch_versions()
     try:
-        response = requests.get(f"{API_URL}/{endpoint}")
-        response.raise_for_status()  # Kiểm tra lỗi HTTP
-        data = response.json()  # Dữ liệu trả về dưới dạng dict hoặc list
+        data = get_json(endpoint, (boot_id, data_versions.get(endpoint)))  # Dữ liệu trả về dưới dạng dict hoặc list
         return pd.DataFrame(data[endpoint])  # Chuyển dữ liệu thành DataFrame        
     except requests.exceptions.RequestException as e:
         st.error(f"Error fetching data from API at {endpoint}: {e}")
         return pd.DataFrame()  # Trả về DataFrame rỗng nếu có lỗi
 
 
-movies = fetch_data("movies")
 users = fetch_data("users")
 
 # Fetch recommendations from the API based on user and algorithm
+# Endpoint batch trả về sẵn thông tin phim (title, poster, date) theo đúng thứ hạng;
+# kết quả được cache theo phiên bản snapshot gợi ý của API
 def fetch_recommendations(user_id, algorithm):
-    endpoint = f"recommendations/{user_id}/{algorithm}"
+    payload = {"userIds": [user_id], "algorithms": [algorithm]}
+    boot_id, version, _ = fetch_versions()
     try:
-        response = requests.get(f"{API_URL}/{endpoint}")
-        response.raise_for_status()  # Check for HTTP errors
-        data = response.json()
-        return data # Extract the list of recommended movies
+        data = post_json("recommendations/batch", payload, (boot_id, version))
+        return data["results"].get(user_id, {}).get(algorithm, []) # Extract the list of recommended movies
     except requests.exceptions.RequestException as e:
         return []
 
@@ -143,7 +165,7 @@ if st.session_state["show_rating_form"]:
 
 
 
-selected_algo = st.sidebar.selectbox("Thuật toán:", ["Girvan Newman", "Louvain", "Predicted Links", "Information Diffusion (IC)"])
+selected_algo = st.sidebar.selectbox("Thuật toán:", ["Girvan Newman", "Louvain", "Predicted Links", "Information Diffusion (IC)", "Information Diffusion (IC, CELF)"])
 
 # Display movie
 def display_movie(recommendations):
@@ -220,12 +242,7 @@ def display_movie(recommendations):
     </style>    
 """, unsafe_allow_html=True)
     
-    global movies
-
-    movie_rcm = movies[movies['tmdbId'].isin(recommendations)]
-
-    # Chuyển DataFrame thành danh sách từ điển
-    movies_list = movie_rcm.to_dict(orient='records')
+    movies_list = recommendations
 
     num_columns = 5  # Số lượng cột trên mỗi hàng
     rows = [movies_list[i:i + num_columns] for i in range(0, len(movies_list), num_columns)]  # Chia phim thành các hàng
@@ -253,7 +270,8 @@ algothims = {
     "Girvan Newman": "girvan_newman",
     "Louvain": "louvain",
     "Predicted Links": "predict_links",
-    "Information Diffusion (IC)": "information_diffusion_ic"
+    "Information Diffusion (IC)": "information_diffusion_ic",
+    "Information Diffusion (IC, CELF)": "information_diffusion_ic_celf"
 }
 
 # Display recommendations
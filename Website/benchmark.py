@@ -0,0 +1,239 @@
+"""Đo thời gian và bộ nhớ của bước chiếu đồ thị và từng thuật toán gợi ý theo kích thước dữ liệu.
+
+Chạy trong thư mục ./Website, không cần mạng hay GPU:
+
+    python benchmark.py --synthetic 1000x300x5000 4000x1000x20000 --prefix 500 2000 0
+    python benchmark.py --algorithms louvain predict_links --output results.json
+    python benchmark.py --projection-mode cosine --top-k 20
+
+Kết quả được ghi ra một file JSON (mỗi dòng trong "results" là một lần đo) để có thể so sánh giữa các commit.
+"""
+from datetime import datetime, timezone
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import API.community_recommendation as cr
+import API.sparse_graph as sg
+from API.main import algorithms
+
+DATASET_PATH = "../Dataset/Dataset.csv"
+
+def synthetic_ratings(n_users, n_movies, n_ratings, user_exponent=1.2, movie_exponent=1.0, seed=42):
+    """Sinh dữ liệu rating bipartite với số lượt đánh giá của user và độ phổ biến của phim theo luật luỹ thừa."""
+    rng = np.random.default_rng(seed)
+    user_weights = 1.0 / np.arange(1, n_users + 1) ** user_exponent
+    movie_weights = 1.0 / np.arange(1, n_movies + 1) ** movie_exponent
+    users = rng.choice(n_users, size=n_ratings, p=user_weights / user_weights.sum())
+    movies = rng.choice(n_movies, size=n_ratings, p=movie_weights / movie_weights.sum())
+
+    ratings = pd.DataFrame({
+        "userId": pd.Series(users).map(lambda i: f"U{i}"),
+        "tmdbId": movies.astype(np.int64) + 1,
+        "rating": rng.integers(1, 11, size=n_ratings) / 2.0,
+        "timestamp": rng.integers(1_500_000_000, 1_700_000_000, size=n_ratings),
+    })
+    # Mỗi cặp (user, phim) chỉ được đánh giá một lần như trong dữ liệu thật
+    return ratings.drop_duplicates(["userId", "tmdbId"], ignore_index=True)
+
+def dataset_prefix(rows, path=DATASET_PATH):
+    # Giống load_data: lấy `rows` dòng đầu của Dataset.csv (0 = toàn bộ)
+    df = pd.read_csv(path, header=0)[:rows or None].dropna()
+    return df[["userId", "tmdbId", "rating", "timestamp"]].reset_index(drop=True)
+
+def measure(fn, repeat=3, trace_memory=True, on_run=None):
+    """Đo thời gian (trung vị và nhỏ nhất của `repeat` lần) và bộ nhớ đỉnh của fn.
+
+    Bộ nhớ được đo trong một lần chạy riêng vì tracemalloc làm sai lệch thời gian.
+    `on_run` (nếu có) được gọi sau mỗi lần chạy xong.
+    """
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        output = fn()
+        timings.append(time.perf_counter() - start)
+        if on_run:
+            on_run()
+
+    peak_memory = None
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if on_run:
+            on_run()
+
+    return output, {
+        "seconds_median": statistics.median(timings),
+        "seconds_min": min(timings),
+        "peak_memory_bytes": peak_memory,
+    }
+
+def reset_state():
+    # Xoá các kết quả trung gian được cache giữa các lần chạy để mỗi lần đo đều tính từ đầu
+    cr.seed_sets.clear()
+    cr.link_partners.clear()
+    cr.link_followers.clear()
+    cr.link_index.clear()
+    cr.infected_users.clear()
+    cr.louvain_partition.clear()
+    cr.louvain_touched.clear()
+
+def measure_algorithm(conn, algo, projection, edges, repeat, trace_memory, settings):
+    # Chạy trong tiến trình con: báo về sau mỗi lần chạy để tiến trình cha áp thời hạn cho từng lần
+    for name, value in settings.items():
+        setattr(cr, name, value)
+
+    def run():
+        reset_state()
+        # Dùng chung phép chiếu đã đo (không tính vào thời gian của thuật toán), chỉ xoá đồ thị
+        # NetworkX mà UserProjection cache lại để mỗi lần chạy đều dựng lại nó
+        projection._graph = None
+        return algorithms[algo](projection, edges)
+
+    try:
+        output, stats = measure(run, repeat, trace_memory, on_run=lambda: conn.send(None))
+        conn.send(("done", len(output), stats))
+    except Exception as e:
+        conn.send(("error", repr(e)))
+    finally:
+        conn.close()
+
+def measure_in_subprocess(algo, projection, edges, repeat, trace_memory, budget, settings):
+    """Đo một thuật toán trong tiến trình con; mỗi lần chạy quá `budget` giây (0 = không giới hạn)
+    thì dừng tiến trình con và trả về None."""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    worker = multiprocessing.Process(
+        target=measure_algorithm, args=(sender, algo, projection, edges, repeat, trace_memory, settings),
+    )
+    worker.start()
+    sender.close()
+    try:
+        while True:
+            if not receiver.poll(budget or None):
+                return None
+            message = receiver.recv()
+            if message is not None:
+                return message
+    except EOFError:
+        return ("error", f"worker exited with code {worker.exitcode}")
+    finally:
+        if worker.is_alive():
+            worker.terminate()
+        worker.join()
+        receiver.close()
+
+def run_case(name, ratings, algorithm_names, repeat, trace_memory, budget, over_budget, options=None, settings=None):
+    """Đo bước chiếu và từng thuật toán trên một bộ dữ liệu; trả về danh sách kết quả."""
+    edges = list(zip(ratings["userId"], ratings["tmdbId"]))
+    projection, stats = measure(lambda: sg.UserProjection(ratings, options), repeat, trace_memory)
+    case = {
+        "dataset": name,
+        "ratings": len(ratings),
+        "users": projection.number_of_nodes(),
+        "movies": len(projection.movie_ids),
+        "projection_edges": projection.number_of_edges(),
+    }
+    results = [{**case, "stage": "projection", "output_size": projection.number_of_edges(), **stats}]
+    print(f"{name}: {case['ratings']} ratings, {case['users']} users, {case['projection_edges']} edges")
+
+    for algo in algorithm_names:
+        # Bỏ qua thuật toán đã vượt ngân sách thời gian ở một kích thước nhỏ hơn
+        if algo in over_budget:
+            results.append({**case, "stage": algo, "skipped": "over budget"})
+            continue
+
+        message = measure_in_subprocess(algo, projection, edges, repeat, trace_memory, budget, settings or {})
+        if message is None:
+            results.append({**case, "stage": algo, "skipped": "timeout"})
+            print(f"  {algo}: timeout after {budget:g}s")
+            over_budget.add(algo)
+            continue
+        if message[0] == "error":
+            results.append({**case, "stage": algo, "error": message[1]})
+            print(f"  {algo}: error {message[1]}")
+            continue
+        _, output_size, stats = message
+        results.append({**case, "stage": algo, "output_size": output_size, **stats})
+        peak = "n/a" if stats["peak_memory_bytes"] is None else f"{stats['peak_memory_bytes']:,} bytes"
+        print(f"  {algo}: {stats['seconds_median']:.3f}s, peak {peak}")
+        if budget and stats["seconds_median"] > budget:
+            over_budget.add(algo)
+    return results
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+def parse_size(value):
+    try:
+        n_users, n_movies, n_ratings = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected USERSxMOVIESxRATINGS, got {value!r}")
+    return n_users, n_movies, n_ratings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", nargs="*", type=parse_size, default=[(500, 200, 2000), (2000, 600, 8000)],
+                        metavar="USERSxMOVIESxRATINGS", help="kích thước dữ liệu tổng hợp")
+    parser.add_argument("--prefix", nargs="*", type=int, default=[200, 1000, 0],
+                        help="số dòng đầu của Dataset.csv (0 = toàn bộ)")
+    parser.add_argument("--algorithms", nargs="*", choices=list(algorithms), default=list(algorithms))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="không đo bộ nhớ bằng tracemalloc")
+    parser.add_argument("--budget", type=float, default=60.0,
+                        help="dừng lần chạy quá số giây này và bỏ qua kích thước lớn hơn cho thuật toán đó (0 = không giới hạn)")
+    parser.add_argument("--processes", type=int, default=1, help="số tiến trình cho mô phỏng IC")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--projection-mode", choices=sg.PROJECTION_MODES, default="count")
+    parser.add_argument("--threshold", type=float, default=0.0, help="bỏ cạnh chiếu có trọng số nhỏ hơn ngưỡng")
+    parser.add_argument("--top-k", type=int, default=0, help="chỉ giữ k hàng xóm mạnh nhất của mỗi user (0 = tất cả)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    # Không ghi phân hoạch Girvan-Newman ra đĩa để mỗi lần đo đều tính lại; cấu hình này được áp lại
+    # trong tiến trình con chạy từng thuật toán
+    settings = {"gn_cache_path": None, "ic_processes": args.processes}
+
+    cases = [
+        (f"synthetic-{u}x{m}x{r}", lambda u=u, m=m, r=r: synthetic_ratings(u, m, r, seed=args.seed))
+        for u, m, r in args.synthetic
+    ]
+    if args.prefix and os.path.exists(DATASET_PATH):
+        cases += [(f"dataset-{rows or 'all'}", lambda rows=rows: dataset_prefix(rows)) for rows in args.prefix]
+
+    options = sg.ProjectionOptions(mode=args.projection_mode, threshold=args.threshold, top_k=args.top_k)
+    results = []
+    over_budget = {"synthetic": set(), "dataset": set()}
+    for name, load in cases:
+        results += run_case(name, load(), args.algorithms, args.repeat, not args.no_memory,
+                            args.budget, over_budget[name.split("-")[0]], options, settings)
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "arguments": vars(args), "results": results}, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+if __name__ == "__main__":
+    main()
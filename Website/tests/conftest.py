@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Các test import module theo tiền tố API. giống khi chạy server trong thư mục ./Website
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,25 @@
+from API.ingest import read_movies, read_ratings
+
+def test_ratings_keep_only_complete_rows_of_movies_with_metadata(tmp_path):
+    path = tmp_path / "ratings.csv"
+    path.write_text(
+        "userId,rating,timestamp,tmdbId,title,poster,date_published\n"
+        "U1,4.0,1,10,Movie A,a.jpg,2020-01-01\n"
+        "U1,3.0,2,20,,b.jpg,2021-01-01\n"
+        "U2,5.0,3,20,,b.jpg,2021-01-01\n"
+        "U2,2.0,4,30,Movie C,c.jpg,2022-01-01\n"
+        "U3,1.0,,30,Movie C,c.jpg,2022-01-01\n"
+        "U3,1.0,6,,Movie D,d.jpg,2023-01-01\n"
+        "U4,,7,10,Movie A,a.jpg,2020-01-01\n",
+        encoding="utf-8",
+    )
+
+    movies = read_movies(path)
+    assert sorted(movies) == [10, 30]
+
+    data = read_ratings(path, movie_ids=movies.keys())
+    assert data.movie_ids.tolist() == [10, 30]
+    assert data.user_ids.tolist() == ["U1", "U2"]
+    assert data.timestamp.tolist() == [1, 4]
+    for tmdb_id in data.movie_ids.tolist():
+        assert movies[tmdb_id]['tmdbId'] == tmdb_id
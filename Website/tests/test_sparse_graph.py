@@ -0,0 +1,192 @@
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+import API.sparse_graph as sg
+
+METHODS = ("Common Neighbors", "Jaccard Coefficient", "Adamic-Adar Index", "Preferential Attachment")
+
+def random_graph(n=40, p=0.15, seed=1):
+    graph = nx.gnp_random_graph(n, p, seed=seed)
+    return graph, sp.csr_matrix(nx.to_scipy_sparse_array(graph, nodelist=range(n), format="csr"))
+
+def networkx_scores(graph, pairs):
+    # Điểm tham chiếu của NetworkX cho từng cặp (i, j)
+    pairs = list(pairs)
+    return {
+        "Common Neighbors": {(i, j): len(list(nx.common_neighbors(graph, i, j))) for i, j in pairs},
+        "Jaccard Coefficient": {(i, j): s for i, j, s in nx.jaccard_coefficient(graph, pairs)},
+        "Adamic-Adar Index": {(i, j): s for i, j, s in nx.adamic_adar_index(graph, pairs)},
+        "Preferential Attachment": {(i, j): s for i, j, s in nx.preferential_attachment(graph, pairs)},
+    }
+
+def collect(scored):
+    scores = {method: {} for method in METHODS}
+    for i, j, method, score in scored:
+        scores[method][(i, j)] = score
+    return scores
+
+def assert_scores_equal(actual, expected):
+    for method in METHODS:
+        assert actual[method].keys() == expected[method].keys(), method
+        for pair, score in expected[method].items():
+            assert actual[method][pair] == pytest.approx(score, rel=0, abs=1e-12), (method, pair)
+
+def test_score_links_matches_networkx():
+    graph, adjacency = random_graph()
+    n = graph.number_of_nodes()
+    # Ngưỡng 0 và k = n - 1: mọi cặp chưa có cạnh đều được trả về
+    thresholds = dict.fromkeys(METHODS, 0)
+    actual = collect(sg.score_links(adjacency, thresholds, k=n - 1))
+
+    pairs = [(i, j) for i in range(n) for j in range(n) if i != j and not graph.has_edge(i, j)]
+    assert_scores_equal(actual, networkx_scores(graph, pairs))
+
+def test_score_links_rows_and_thresholds():
+    graph, adjacency = random_graph()
+    thresholds = {"Common Neighbors": 2, "Jaccard Coefficient": 0.1, "Adamic-Adar Index": 0.5, "Preferential Attachment": 30}
+    full = collect(sg.score_links(adjacency, thresholds, k=3))
+    rows = [0, 7, 19, 33]
+    partial = collect(sg.score_links(adjacency, thresholds, k=3, block_elements=50, rows=rows))
+
+    for method, threshold in thresholds.items():
+        assert partial[method] == {pair: s for pair, s in full[method].items() if pair[0] in rows}
+        assert all(score >= threshold for score in full[method].values())
+        per_row = pd.Series([i for i, _ in full[method]]).value_counts()
+        assert per_row.max() <= 3
+
+def test_score_candidate_links_matches_networkx():
+    graph, adjacency = random_graph()
+    n = graph.number_of_nodes()
+    rng = np.random.default_rng(0)
+    rows, cols = rng.integers(0, n, 300), rng.integers(0, n, 300)
+    # Cặp trùng, cặp với chính mình và cặp đã có cạnh bị bỏ qua
+    rows = np.append(rows, [rows[0], 5, *next(iter(graph.edges()))])
+    cols = np.append(cols, [cols[0], 5, *reversed(next(iter(graph.edges())))])
+    thresholds = dict.fromkeys(METHODS, 0)
+    actual = collect(sg.score_candidate_links(adjacency, rows, cols, thresholds, k=n))
+
+    pairs = {(i, j) for i, j in zip(rows.tolist(), cols.tolist()) if i != j and not graph.has_edge(i, j)}
+    assert_scores_equal(actual, networkx_scores(graph, sorted(pairs)))
+
+def modularity(graph, labels):
+    communities = {}
+    for node, label in enumerate(labels.tolist()):
+        communities.setdefault(label, set()).add(node)
+    return nx.community.modularity(graph, communities.values())
+
+def test_move_nodes_returns_misplaced_node_to_its_clique():
+    graph = nx.disjoint_union(nx.complete_graph(5), nx.complete_graph(5))
+    graph.add_edge(4, 5)
+    adjacency = nx.to_scipy_sparse_array(graph, nodelist=range(10), format="csr")
+    labels = np.array([0, 0, 0, 0, 0, 1, 1, 1, 1, 1])
+    misplaced = labels.copy()
+    misplaced[2] = 1
+
+    assert sg.move_nodes(adjacency, misplaced, [2]).tolist() == labels.tolist()
+    # Node ngoài frontier không bị xét
+    assert sg.move_nodes(adjacency, misplaced, [7]).tolist() == misplaced.tolist()
+
+def test_move_nodes_does_not_decrease_modularity():
+    graph, adjacency = random_graph(60, 0.08, seed=3)
+    labels = np.random.default_rng(1).integers(0, 6, 60)
+    moved = sg.move_nodes(adjacency, labels, range(60))
+    assert modularity(graph, moved) >= modularity(graph, labels)
+
+def reference_degree_discount(graph, k, p):
+    # Cài đặt trực tiếp theo Chen et al. (2009), hoà thì chọn node có chỉ số nhỏ nhất
+    degree = dict(graph.degree())
+    discounted, selected_neighbors, seeds = dict(degree), dict.fromkeys(graph, 0), []
+    for _ in range(k):
+        u = max((v for v in graph if v not in seeds), key=lambda v: (discounted[v], -v))
+        seeds.append(u)
+        for v in graph[u]:
+            if v not in seeds:
+                selected_neighbors[v] += 1
+                t = selected_neighbors[v]
+                discounted[v] = degree[v] - 2 * t - (degree[v] - t) * t * p
+    return seeds
+
+def test_degree_discount_matches_reference():
+    graph, adjacency = random_graph(80, 0.06, seed=5)
+    assert sg.degree_discount_seeds(adjacency, 10, p=0.05) == reference_degree_discount(graph, 10, 0.05)
+
+@pytest.mark.parametrize("plus", [False, True])
+def test_celf_covers_largest_components_when_spread_is_deterministic(plus):
+    # p = 1: độ lan truyền của một tập nguồn là tổng kích thước các thành phần liên thông chứa nó
+    graph = nx.disjoint_union_all([nx.path_graph(size) for size in (6, 2, 9, 4, 1)])
+    adjacency = nx.to_scipy_sparse_array(graph, nodelist=range(graph.number_of_nodes()), format="csr")
+    seeds = sg.celf_seeds(adjacency, 3, p=1.0, runs=1, weighted=False, seed=0, plus=plus)
+
+    components = [frozenset(c) for c in nx.connected_components(graph)]
+    covered = {c for c in components for s in seeds if s in c}
+    assert len(covered) == 3
+    assert sorted(len(c) for c in covered) == [4, 6, 9]
+
+def test_celf_plus_agrees_with_celf():
+    _, adjacency = random_graph(30, 0.12, seed=4)
+    options = dict(p=0.1, runs=50, seed=7)
+    assert sg.celf_seeds(adjacency, 6, plus=True, **options) == sg.celf_seeds(adjacency, 6, plus=False, **options)
+
+def random_ratings(n_users=30, n_movies=15, n_ratings=120, seed=0):
+    rng = np.random.default_rng(seed)
+    ratings = pd.DataFrame({
+        "userId": [f"U{i}" for i in rng.integers(0, n_users, n_ratings)],
+        "tmdbId": rng.integers(1, n_movies + 1, n_ratings),
+        "rating": rng.integers(1, 11, n_ratings) / 2.0,
+        "timestamp": np.arange(n_ratings),
+    })
+    return ratings.drop_duplicates(["userId", "tmdbId"], ignore_index=True)
+
+def new_ratings(seed=1):
+    # Gồm user mới, phim mới và một cặp (user, phim) đánh giá lại
+    rng = np.random.default_rng(seed)
+    extra = [(f"U{rng.integers(0, 30)}", int(rng.integers(1, 16)), 4.0) for _ in range(25)]
+    return extra + [("Unew", 3, 5.0), ("Unew", 99, 3.0), ("U1", 99, 2.5), (extra[0][0], extra[0][1], 1.0)]
+
+def test_minhash_add_edges_matches_rebuild():
+    ratings = random_ratings()
+    projection = sg.UserProjection(ratings)
+    index = sg.MinHashIndex(num_perm=32, bands=16)
+    index.build(projection.incidence, projection.user_ids.tolist())
+
+    core = sg.GraphCore(projection)
+    rows = [ratings]
+    for user, movie, rating in new_ratings():
+        affected = core.add_rating(user, movie, rating)
+        index.add_edges(user, [core.users.ids[u] for u in affected])
+        rows.append(pd.DataFrame([(user, movie, rating, 0)], columns=ratings.columns))
+
+    rebuilt = sg.UserProjection(pd.concat(rows, ignore_index=True))
+    fresh = sg.MinHashIndex(num_perm=32, bands=16)
+    fresh.build(rebuilt.incidence, rebuilt.user_ids.tolist())
+
+    assert sorted(index.users.ids) == sorted(fresh.users.ids)
+    for user in fresh.users.ids:
+        assert (index.signatures[index.users.index[user]] == fresh.signatures[fresh.users.index[user]]).all(), user
+    as_ids = lambda idx: [{key: {idx.users.ids[c] for c in members} for key, members in buckets.items()} for buckets in idx.buckets]
+    assert as_ids(index) == as_ids(fresh)
+
+def test_graph_core_incremental_matches_rebuild():
+    ratings = random_ratings()
+    core = sg.GraphCore(sg.UserProjection(ratings))
+    rows = [ratings]
+    for user, movie, rating in new_ratings():
+        core.adjacency()  # Ma trận kề đã dựng phải được vá cùng với từng rating
+        core.add_rating(user, movie, rating)
+        rows.append(pd.DataFrame([(user, movie, rating, 0)], columns=ratings.columns))
+    rebuilt = sg.UserProjection(pd.concat(rows, ignore_index=True))
+    fresh = sg.GraphCore(rebuilt)
+
+    user_ids = core.users.ids
+    assert sorted(user_ids) == sorted(fresh.users.ids)
+    assert core.number_of_ratings == fresh.number_of_ratings
+    assert core.number_of_edges == fresh.number_of_edges
+    order = [fresh.users.index[user] for user in user_ids]
+    assert core.degrees.tolist() == fresh.degrees[order].tolist()
+    assert (core.adjacency() != rebuilt.weights[order][:, order]).nnz == 0
+    for u, user in enumerate(user_ids):
+        assert core.movie_ratings(user) == fresh.movie_ratings(user), user
+        expected = {fresh.users.ids[v]: w for v, w in fresh.neighbors(fresh.users.index[user]).items()}
+        assert {user_ids[v]: w for v, w in core.neighbors(u).items()} == expected, user